@@ -0,0 +1,189 @@
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Final
+import mmap
+
+WAVEFORM_NAMES: Final[list[str]] = ["AUTO", "DU", "A2", "GL16", "GC16", "REAGL"]
+
+
+class RenderBackend(ABC):
+    @abstractmethod
+    def getScreenSize(self) -> tuple[int, int]:
+        raise NotImplementedError
+
+    def wrapBuffer(self, buffer: bytearray):
+        # Returns a handle that printRawData accepts with an offset into it
+        return buffer
+
+    @abstractmethod
+    def printRawData(self, data, offset: int, width: int, height: int, length: int, xPos: int, yPos: int):
+        raise NotImplementedError
+
+    @abstractmethod
+    def refresh(self, top: int, left: int, width: int, height: int, waveform: str, flashing: bool):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class FBInkBackend(RenderBackend):
+    def __init__(self):
+        from _fbink import ffi, lib as FBInk
+
+        self.ffi = ffi
+        self.FBInk = FBInk
+        self.config = ffi.new("FBInkConfig *")
+        self.config.is_centered = True
+        self.config.is_halfway = True
+        # Blits never refresh on their own, draw.refreshScreen does it
+        self.config.no_refresh = True
+        self.waveforms = {name: getattr(FBInk, f"WFM_{name}")
+                          for name in WAVEFORM_NAMES}
+
+        self.fbfd = FBInk.fbink_open()
+        FBInk.fbink_init(self.fbfd, self.config)
+        self.state = ffi.new("FBInkState *")
+        FBInk.fbink_get_state(self.config, self.state)
+
+    def getScreenSize(self) -> tuple[int, int]:
+        return (self.state.screen_width, self.state.screen_height)
+
+    def wrapBuffer(self, buffer: bytearray):
+        # The buffer must not be resized after this, cffi holds a view into it
+        return self.ffi.from_buffer("unsigned char[]", buffer)
+
+    def printRawData(self, data, offset: int, width: int, height: int, length: int, xPos: int, yPos: int):
+        if offset:
+            data = data + offset
+        self.FBInk.fbink_print_raw_data(
+            self.fbfd, data, width, height, length, xPos, yPos, self.config)
+
+    def refresh(self, top: int, left: int, width: int, height: int, waveform: str, flashing: bool):
+        self.config.wfm_mode = self.waveforms[waveform]
+        self.config.is_flashing = flashing
+        self.FBInk.fbink_refresh(
+            self.fbfd, top, left, width, height, self.config)
+
+    def close(self):
+        self.FBInk.fbink_close(self.fbfd)
+
+
+class NullBackend(RenderBackend):
+    def __init__(self, screenWidth: int = 1072, screenHeight: int = 1448):
+        self.screenWidth = screenWidth
+        self.screenHeight = screenHeight
+
+    def getScreenSize(self) -> tuple[int, int]:
+        return (self.screenWidth, self.screenHeight)
+
+    def wrapBuffer(self, buffer: bytearray):
+        return memoryview(buffer)
+
+    def printRawData(self, data, offset: int, width: int, height: int, length: int, xPos: int, yPos: int):
+        pass
+
+    def refresh(self, top: int, left: int, width: int, height: int, waveform: str, flashing: bool):
+        pass
+
+
+@dataclass
+class RenderStats:
+    blits: int = 0
+    bytesCopied: int = 0
+    pixelsDrawn: int = 0
+    refreshes: int = 0
+    flashingRefreshes: int = 0
+    refreshedArea: int = 0
+
+
+class MemoryBackend(RenderBackend):
+    """Draws into an anonymous mmap holding an RGB framebuffer and counts
+    what every blit and refresh would cost on the device."""
+
+    def __init__(self, screenWidth: int = 1072, screenHeight: int = 1448):
+        self.screenWidth = screenWidth
+        self.screenHeight = screenHeight
+        self.framebuffer = mmap.mmap(-1, screenWidth * screenHeight * 3)
+        self.pixels = memoryview(self.framebuffer)
+        self.stats = RenderStats()
+
+    def getScreenSize(self) -> tuple[int, int]:
+        return (self.screenWidth, self.screenHeight)
+
+    def wrapBuffer(self, buffer: bytearray):
+        return memoryview(buffer)
+
+    def printRawData(self, data, offset: int, width: int, height: int, length: int, xPos: int, yPos: int):
+        # Same rule as FBInk: the pixel format follows from the length
+        channels = length // (width * height)
+        if channels not in (1, 2, 3, 4):
+            raise ValueError(f"Unsupported raw data of {length} bytes "
+                             f"for {width}x{height}")
+        self.stats.blits += 1
+        self.stats.bytesCopied += length
+
+        left = max(0, xPos)
+        top = max(0, yPos)
+        right = min(self.screenWidth, xPos + width)
+        bottom = min(self.screenHeight, yPos + height)
+        if right <= left or bottom <= top:
+            return
+        self.stats.pixelsDrawn += (right - left) * (bottom - top)
+
+        source = memoryview(data)[offset:offset + length]
+        lineLength = width * channels
+        rowLength = self.screenWidth * 3
+        for y in range(top, bottom):
+            start = (y - yPos) * lineLength + (left - xPos) * channels
+            line = source[start:start + (right - left) * channels]
+            position = y * rowLength + left * 3
+            row = self.pixels[position:position + (right - left) * 3]
+            if channels == 3:
+                row[:] = line
+            elif channels == 4:
+                # Alpha is dropped, sprites are opaque
+                row[0::3] = line[0::4]
+                row[1::3] = line[1::4]
+                row[2::3] = line[2::4]
+            else:
+                gray = line[0::channels]
+                row[0::3] = gray
+                row[1::3] = gray
+                row[2::3] = gray
+
+    def refresh(self, top: int, left: int, width: int, height: int, waveform: str, flashing: bool):
+        if width == 0 and height == 0:
+            # FBInk treats an empty region as the whole screen
+            width = self.screenWidth
+            height = self.screenHeight
+        self.stats.refreshes += 1
+        self.stats.flashingRefreshes += flashing
+        self.stats.refreshedArea += width * height
+
+    def takeStats(self) -> RenderStats:
+        stats = self.stats
+        self.stats = RenderStats()
+        return stats
+
+    def dumpImage(self, path: str):
+        # Binary PPM, readable by PIL and most image viewers
+        with open(path, "wb") as file:
+            file.write(f"P6\n{self.screenWidth} {self.screenHeight}\n255\n"
+                       .encode("ascii"))
+            file.write(self.framebuffer)
+
+    def close(self):
+        self.pixels.release()
+        self.framebuffer.close()
+
+
+BACKENDS: Final[dict[str, type[RenderBackend]]] = {
+    "fbink": FBInkBackend,
+    "memory": MemoryBackend,
+    "null": NullBackend,
+}
+
+
+def createBackend(name: str) -> RenderBackend:
+    return BACKENDS[name]()
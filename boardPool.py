@@ -0,0 +1,297 @@
+import argparse
+import fcntl
+import multiprocessing
+import os
+import random
+import struct
+import sys
+from common import Game
+from engine import createGame, createGameFromLayout, openCell
+from solver import createSolver, getHint, markChanged
+from typing import Final, Optional
+
+path = os.path.dirname(__file__)
+
+POOL_DIRECTORY: Final[str] = f"{path}/pools"
+# A pool file is this header followed by fixed-size records, one per board:
+# the start cell, then one bit per cell set where a mine is
+POOL_MAGIC: Final[bytes] = b"KMSPOOL1"
+POOL_HEADER: Final[struct.Struct] = struct.Struct('<8sHHI')
+START_STRUCT: Final[struct.Struct] = struct.Struct('<I')
+
+# The device starts a refill once a pool holds fewer boards than this
+POOL_LOW_WATER: Final[int] = 3
+# and fills it back up to this many
+POOL_REFILL_TARGET: Final[int] = 10
+# Candidate boards handed out per generator process at a time
+GENERATE_BATCH: Final[int] = 8
+# Nice value for the refill process, so it only uses idle CPU
+REFILL_NICENESS: Final[int] = 15
+# Candidates one refill tries before giving up. Dense boards are almost
+# never solvable without a guess and would keep the CPU busy for good
+REFILL_MAX_ATTEMPTS: Final[int] = 200
+# Exit code of a refill that reached REFILL_MAX_ATTEMPTS
+REFILL_GAVE_UP: Final[int] = 3
+# Candidates boardPool.py tries per requested board by default
+ATTEMPTS_PER_BOARD: Final[int] = 50
+
+# (start cell, cells with mines)
+PoolBoard = tuple[int, list[int]]
+
+_refillProcess: Optional[multiprocessing.Process] = None
+# (x, y, mines) of the board _refillProcess fills
+_refillKey: Optional[tuple[int, int, int]] = None
+# Boards a refill gave up on, not retried this session
+_exhaustedPools: set[tuple[int, int, int]] = set()
+
+
+def getPoolPath(x: int, y: int, mines: int) -> str:
+    return f"{POOL_DIRECTORY}/{x}x{y}x{mines}.pool"
+
+
+def getRecordSize(x: int, y: int) -> int:
+    return START_STRUCT.size + (x * y + 7) // 8
+
+
+def packBoard(x: int, y: int, board: PoolBoard) -> bytes:
+    start, mines = board
+    bits = bytearray((x * y + 7) // 8)
+    for index in mines:
+        bits[index >> 3] |= 1 << (index & 7)
+    return START_STRUCT.pack(start) + bits
+
+
+def unpackBoard(record: bytes) -> PoolBoard:
+    (start,) = START_STRUCT.unpack_from(record)
+    bits = record[START_STRUCT.size:]
+    mines = [byteIndex * 8 + bit for byteIndex, byte in enumerate(bits) if byte
+             for bit in range(8) if byte >> bit & 1]
+    return (start, mines)
+
+
+def isSolvable(game: Game) -> bool:
+    # Plays the board with the hint solver, only ever opening cells it has
+    # proven safe. Stuck without a safe cell means a guess would be needed
+    solver = createSolver(game)
+    while not game.gameOver:
+        hint = getHint(solver)
+        if hint is None or hint[1] > 0:
+            return False
+        update = openCell(game, hint[0])
+        markChanged(solver, update.rects)
+    return not game.hitMine
+
+
+def generateBoard(x: int, y: int, mines: int, seed: int) -> Optional[PoolBoard]:
+    # The start cell is opened with a clear 3x3 zone, so the first tap
+    # always opens an area to reason from
+    rng = random.Random(seed)
+    game = createGame(x, y, mines, rng.getrandbits(32), safeZone=True)
+    start = rng.randrange(x * y)
+    openCell(game, start)
+    board = (start, sorted(game.mines))
+    if not isSolvable(game):
+        return None
+    return board
+
+
+def _generateWorker(task: tuple[int, int, int, int]) -> Optional[bytes]:
+    x, y, mines, seed = task
+    board = generateBoard(x, y, mines, seed)
+    if board is None:
+        return None
+    return packBoard(x, y, board)
+
+
+def _openPool(x: int, y: int, mines: int) -> int:
+    os.makedirs(POOL_DIRECTORY, exist_ok=True)
+    fd = os.open(getPoolPath(x, y, mines), os.O_RDWR | os.O_CREAT, 0o644)
+    # Held until the fd is closed, the game and refills may run at once
+    fcntl.flock(fd, fcntl.LOCK_EX)
+    size = os.fstat(fd).st_size
+    if size < POOL_HEADER.size:
+        os.ftruncate(fd, 0)
+        os.write(fd, POOL_HEADER.pack(POOL_MAGIC, x, y, mines))
+        return fd
+    magic, poolX, poolY, poolMines = POOL_HEADER.unpack(
+        os.pread(fd, POOL_HEADER.size, 0))
+    if magic != POOL_MAGIC or (poolX, poolY, poolMines) != (x, y, mines):
+        os.close(fd)
+        raise ValueError(f"{getPoolPath(x, y, mines)} is not a pool "
+                         f"for {x}x{y} with {mines} mines")
+    return fd
+
+
+def _getPoolCount(fd: int, x: int, y: int) -> int:
+    return (os.fstat(fd).st_size - POOL_HEADER.size) // getRecordSize(x, y)
+
+
+def getPoolSize(x: int, y: int, mines: int) -> int:
+    if not os.path.exists(getPoolPath(x, y, mines)):
+        return 0
+    fd = _openPool(x, y, mines)
+    try:
+        return _getPoolCount(fd, x, y)
+    finally:
+        os.close(fd)
+
+
+def addBoards(x: int, y: int, mines: int, records: list[bytes]):
+    fd = _openPool(x, y, mines)
+    try:
+        recordSize = getRecordSize(x, y)
+        # Drop a partial record left by an interrupted write
+        end = POOL_HEADER.size + _getPoolCount(fd, x, y) * recordSize
+        os.pwrite(fd, b"".join(records), end)
+    finally:
+        os.close(fd)
+
+
+def takeBoard(x: int, y: int, mines: int) -> Optional[PoolBoard]:
+    # Pops the last record and shrinks the file, no rewriting
+    if not os.path.exists(getPoolPath(x, y, mines)):
+        return None
+    fd = _openPool(x, y, mines)
+    try:
+        count = _getPoolCount(fd, x, y)
+        if count == 0:
+            return None
+        recordSize = getRecordSize(x, y)
+        offset = POOL_HEADER.size + (count - 1) * recordSize
+        record = os.pread(fd, recordSize, offset)
+        os.ftruncate(fd, offset)
+        return unpackBoard(record)
+    finally:
+        os.close(fd)
+
+
+def fillPool(x: int, y: int, mines: int, count: int, processes: int = 1,
+             seed: Optional[int] = None, maxAttempts: Optional[int] = None) -> tuple[int, int]:
+    """Adds up to count boards, trying at most maxAttempts candidates.
+    Returns (boards added, candidates tried)."""
+    rng = random.Random(seed)
+    added = 0
+    attempts = 0
+    pool = multiprocessing.Pool(processes) if processes > 1 else None
+    try:
+        while added < count and (maxAttempts is None or attempts < maxAttempts):
+            # Bounded batches, the pool would otherwise queue tasks forever
+            batch = GENERATE_BATCH * max(1, processes)
+            if maxAttempts is not None:
+                batch = min(batch, maxAttempts - attempts)
+            tasks = [(x, y, mines, rng.getrandbits(64)) for _ in range(batch)]
+            if pool is None:
+                records = map(_generateWorker, tasks)
+            else:
+                # In task order, so a seed always gives the same pool
+                records = pool.imap(_generateWorker, tasks)
+            for record in records:
+                attempts += 1
+                if record is None:
+                    continue
+                # Written as they come in, an interrupted run keeps its boards
+                addBoards(x, y, mines, [record])
+                added += 1
+                if added >= count:
+                    break
+    finally:
+        if pool is not None:
+            pool.terminate()
+    return (added, attempts)
+
+
+def _getGiveUpMessage(x: int, y: int, mines: int, added: int, attempts: int) -> str:
+    return (f"Accepted {added} of {attempts} {x}x{y} boards with {mines} mines, "
+            f"density too high for no-guess")
+
+
+def _refillTask(x: int, y: int, mines: int):
+    os.nice(REFILL_NICENESS)
+    missing = POOL_REFILL_TARGET - getPoolSize(x, y, mines)
+    if missing <= 0:
+        return
+    added, attempts = fillPool(x, y, mines, missing,
+                               maxAttempts=REFILL_MAX_ATTEMPTS)
+    if added < missing:
+        print(_getGiveUpMessage(x, y, mines, added, attempts))
+        sys.exit(REFILL_GAVE_UP)
+
+
+def _checkRefill():
+    # Remembers boards the last refill gave up on once it has finished
+    global _refillProcess, _refillKey
+    if _refillProcess is None or _refillProcess.is_alive():
+        return
+    if _refillProcess.exitcode == REFILL_GAVE_UP and _refillKey is not None:
+        _exhaustedPools.add(_refillKey)
+    _refillProcess = None
+    _refillKey = None
+
+
+def refillPoolInBackground(x: int, y: int, mines: int):
+    global _refillProcess, _refillKey
+    _checkRefill()
+    if _refillProcess is not None:
+        return
+    if (x, y, mines) in _exhaustedPools:
+        return
+    if getPoolSize(x, y, mines) >= POOL_LOW_WATER:
+        return
+    # A separate process keeps the generator off the game's GIL. Spawned
+    # rather than forked, the game already runs input and render threads
+    context = multiprocessing.get_context("spawn")
+    _refillProcess = context.Process(target=_refillTask, args=(x, y, mines),
+                                     daemon=True)
+    _refillKey = (x, y, mines)
+    _refillProcess.start()
+
+
+def createNoGuessGame(x: int, y: int, mines: int, seed: Optional[int] = None) -> Optional[Game]:
+    try:
+        board = takeBoard(x, y, mines)
+    except ValueError as e:
+        # A damaged or mismatched pool file is left for boardPool.py to
+        # report, the caller deals a random board as for an empty pool
+        print(e)
+        return None
+    # Not restarted for boards a refill already gave up on
+    refillPoolInBackground(x, y, mines)
+    if board is None:
+        return None
+    start, cellsWithMines = board
+    game = createGameFromLayout(x, y, cellsWithMines, start, seed)
+    game.noGuess = True
+    return game
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Generate boards that can be solved without guessing')
+    parser.add_argument('-x', dest='x', type=int, default=9, help='Number of rows')
+    parser.add_argument('-y', dest='y', type=int, default=9, help='Number of columns')
+    parser.add_argument('-mines', dest='mines', type=int, default=10,
+                        help='Number of mines')
+    parser.add_argument('-count', dest='count', type=int, default=100,
+                        help='Boards to add to the pool')
+    parser.add_argument('-processes', dest='processes', type=int,
+                        default=os.cpu_count() or 1,
+                        help='Generator processes')
+    parser.add_argument('-seed', dest='seed', type=int,
+                        help='Seed for reproducible pools')
+    parser.add_argument('-max-attempts', dest='maxAttempts', type=int,
+                        help=f'Candidates to try before giving up, '
+                        f'{ATTEMPTS_PER_BOARD} per board by default')
+    args = parser.parse_args()
+
+    maxAttempts = args.maxAttempts or args.count * ATTEMPTS_PER_BOARD
+    added, attempts = fillPool(args.x, args.y, args.mines, args.count,
+                               args.processes, args.seed, maxAttempts)
+    total = getPoolSize(args.x, args.y, args.mines)
+    if added < args.count:
+        print(_getGiveUpMessage(args.x, args.y, args.mines, added, attempts))
+    print(f"Added {added} boards in {attempts} attempts, "
+          f"{total} in {getPoolPath(args.x, args.y, args.mines)}")
+
+
+if __name__ == "__main__":
+    main()
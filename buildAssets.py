@@ -0,0 +1,48 @@
+import argparse
+import os
+from draw import getLayoutSprites, renderSprite
+from layout import getLayout
+from spritePack import PACK_NAME, SpriteKey, writeSpritePack
+
+path = os.path.dirname(__file__)
+
+
+def parseBoardSize(value: str) -> tuple[int, int]:
+    try:
+        x, y = value.lower().split("x")
+        return (int(x), int(y))
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"{value} is not a board size like 16x16")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Pre-render every sprite into a pack draw.py maps at startup')
+    parser.add_argument('-width', dest='width', type=int, default=1072,
+                        help='Screen width in pixels')
+    parser.add_argument('-height', dest='height', type=int, default=1448,
+                        help='Screen height in pixels')
+    parser.add_argument('-boards', dest='boards', type=parseBoardSize, nargs='+',
+                        default=[(9, 9), (16, 16), (30, 16)],
+                        help='Board sizes to render cells for, like 9x9 16x16')
+    parser.add_argument('-output', dest='output', default=f"{path}/assets/{PACK_NAME}",
+                        help='Where to write the pack')
+    args = parser.parse_args()
+
+    sprites: dict[SpriteKey, bytes] = {}
+    for x, y in args.boards:
+        layout = getLayout(args.width, args.height, x, y)
+        for name, width, height in getLayoutSprites(layout):
+            key = (name, width, height)
+            if key not in sprites:
+                sprites[key] = renderSprite(
+                    f"{path}/assets/{name}", width, height)
+
+    writeSpritePack(args.output, args.width, args.height, sprites)
+    size = sum(len(rawData) for rawData in sprites.values())
+    print(f"Wrote {len(sprites)} sprites ({size} bytes) to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,44 @@
-from dataclasses import dataclass
-from typing import Callable, Optional
+from dataclasses import dataclass, field
+from random import Random
+from typing import Callable, Final, Optional
+from topology import NeighbourTable
 
-
-@dataclass
-class Cell:
-    x: int
-    y: int
-    number: int = 0
-    isFlagged: bool = False
-    isMine: bool = False
-    isOpen: bool = False
-    screenX: int = 0
-    screenY: int = 0
-    size: int = 0
+# Every cell is one byte of Game.board, indexed by y * maxX + x
+CELL_NUMBER: Final[int] = 0x0F
+CELL_MINE: Final[int] = 0x10
+CELL_OPEN: Final[int] = 0x20
+CELL_FLAG: Final[int] = 0x40
+# Set once the game is lost, on the mine that was hit and on wrong flags.
+# On a hidden, unflagged cell it marks the current hint
+CELL_MARKED: Final[int] = 0x80
 
 
 @dataclass
 class Game:
-    cells: list[list[Cell]]
+    board: bytearray
     maxX: int
     maxY: int
     minesCount: int
+    neighbours: NeighbourTable
+    mines: set[int] = field(default_factory=set)
+    flags: set[int] = field(default_factory=set)
+    safeZone: bool = False
+    # Came from the no-guess pool, new games from the smiley do too
+    noGuess: bool = False
     flagsPlaced: int = 0
     nonMineCellsOpened: int = 0
     clicks: int = 0
     startTime: int = 0
-    smileRect: tuple[int, int, int, int] = (0, 0, 0, 0)
     gameOver: bool = False
     hitMine: bool = False
+    # Cell showing the hint, -1 when there is none
+    hint: int = -1
     tapListener: Optional[Callable] = None
     holdEndListener: Optional[Callable] = None
+    swipeListener: Optional[Callable] = None
+    random: Random = field(default_factory=Random)
+
+
+def getCellPosition(game: Game, index: int) -> tuple[int, int]:
+    y, x = divmod(index, game.maxX)
+    return (x, y)
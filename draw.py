@@ -1,15 +1,120 @@
-from _fbink import ffi, lib as FBInk
-from PIL import Image
-from common import Cell, Game
-import math
+from backend import RenderBackend, FBInkBackend
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Final, Optional
+from common import Game, CELL_NUMBER, CELL_MINE, CELL_OPEN, CELL_FLAG, CELL_MARKED, getCellPosition
+from layout import Layout, Rect, getLayout
+from profiler import Stage, spanStart, spanEnd
+from spritePack import PACK_NAME, SpriteKey, SpritePack, openSpritePack
 import os
-
-fbink_cfg = ffi.new("FBInkConfig *")
-fbink_cfg.is_centered = True
-fbink_cfg.is_halfway = True
+import threading
 
 path = os.path.dirname(__file__)
 
+# Holds every sprite of two board sizes plus the HUD, so switching sizes
+# back and forth stays warm while older sizes get evicted
+SPRITE_CACHE_SIZE: Final[int] = 64
+ATLAS_CACHE_SIZE: Final[int] = 2
+
+# Damaged rectangles closer than this many pixels are refreshed as one region
+DAMAGE_MERGE_GAP: Final[int] = 16
+# Past this many regions a single bounding region is cheaper than separate
+# refreshes
+DAMAGE_MAX_REGIONS: Final[int] = 8
+# Refresh the whole screen once the damage covers this much of it
+DAMAGE_FULL_SCREEN_RATIO: Final[float] = 0.6
+
+
+@dataclass
+class SpriteCache:
+    maxEntries: int = SPRITE_CACHE_SIZE
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    sprites: OrderedDict[tuple[str, int, int], bytes] = field(
+        default_factory=OrderedDict)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+@dataclass
+class SpriteAtlas:
+    cellSize: int
+    # A bytearray, or the sprite pack's mmap when it holds every sprite
+    buffer: object
+    # Backend view over buffer, blits pass offsets into it without copying
+    data: object
+    # name -> (offset, length, width, height)
+    sprites: dict[str, tuple[int, int, int, int]]
+    # tileLines[row][tile] is one pixel row of cellImages[tile], used to
+    # gather a whole board bitmap with bytes.join
+    tileLines: list[list[bytes]]
+
+
+@dataclass
+class DotDisplayState:
+    # Where the digits were drawn and the sprite shown in each of them
+    rect: Rect
+    digits: list[str]
+
+
+@dataclass
+class UpdateKind:
+    FAST: Final[str] = "fast"
+    QUALITY: Final[str] = "quality"
+
+
+@dataclass
+class RefreshPolicy:
+    fastWaveform: str = "DU"
+    qualityWaveform: str = "GC16"
+    # Partial refreshes between flashing full refreshes, 0 never flashes
+    fullRefreshEvery: int = 30
+    partialRefreshes: int = 0
+
+
+@dataclass
+class DamageTracker:
+    # UpdateKind -> (left, top, right, bottom), right and bottom exclusive
+    rects: dict[str, list[tuple[int, int, int, int]]] = field(
+        default_factory=dict)
+    autoRefresh: bool = True
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+_spriteCache = SpriteCache()
+_damage = DamageTracker()
+_refreshPolicy = RefreshPolicy()
+_backend: Optional[RenderBackend] = None
+_spritePack: Optional[SpritePack] = None
+_dotDisplays: dict[str, DotDisplayState] = {}
+_atlases: OrderedDict[int, SpriteAtlas] = OrderedDict()
+_atlasLock = threading.Lock()
+_currentAtlas: Optional[SpriteAtlas] = None
+
+cellImages = [
+    "cell_1.png",
+    "cell_2.png",
+    "cell_3.png",
+    "cell_4.png",
+    "cell_5.png",
+    "cell_6.png",
+    "cell_7.png",
+    "cell_8.png",
+    "cell_flag.png",
+    "cell_hidden.png",
+    "cell_mine.png",
+    "cell_minehit.png",
+    "cell_open.png",
+    "cell_wrongflag.png",
+    "cell_hint.png",
+]
+
+smileImages = [
+    "smiley_play.png",
+    "smiley_dead.png",
+    "smiley_win.png",
+]
+
 dotDisplayImages = [
     "number_0.png",
     "number_1.png",
@@ -23,6 +128,18 @@ dotDisplayImages = [
     "number_9.png",
 ]
 
+DOT_DISPLAY_BLANK: Final[str] = "number_blank.png"
+
+CLOSE_ICON: Final[str] = "close.jpg"
+
+# Sprites made from another one by inverting it, with no file of their own
+INVERTED_SPRITES: Final[dict[str, str]] = {
+    "cell_hint.png": "cell_hidden.png",
+}
+INVERT_TABLE: Final[bytes] = bytes(range(255, -1, -1))
+
+cellTiles = {name: i for i, name in enumerate(cellImages)}
+
 
 def getImageNameFromNumber(number: int):
     if number >= 1 and number <= 8:
@@ -31,171 +148,443 @@ def getImageNameFromNumber(number: int):
     return "cell_open.png"
 
 
-def getCellImage(cell: Cell):
-    if not cell.isOpen:
-        if cell.isFlagged:
+def getStateImage(state: int):
+    if not state & CELL_OPEN:
+        if state & CELL_FLAG:
+            if state & CELL_MARKED:
+                return "cell_wrongflag.png"
             return "cell_flag.png"
+        if state & CELL_MARKED:
+            return "cell_hint.png"
         return "cell_hidden.png"
 
-    if cell.isMine:
+    if state & CELL_MINE:
+        if state & CELL_MARKED:
+            return "cell_minehit.png"
         return "cell_mine.png"
 
-    return getImageNameFromNumber(cell.number)
+    return getImageNameFromNumber(state & CELL_NUMBER)
+
+
+# Maps a cell state byte straight to its tile with bytes.translate
+cellStateTiles = bytes(cellTiles[getStateImage(state)] for state in range(256))
+
+
+def getCellImage(game: Game, index: int):
+    return getStateImage(game.board[index])
+
 
+def renderSprite(imagePath: str, width: int, height: int) -> bytes:
+    directory, name = os.path.split(imagePath)
+    if name in INVERTED_SPRITES:
+        source = os.path.join(directory, INVERTED_SPRITES[name])
+        return renderSprite(source, width, height).translate(INVERT_TABLE)
 
-def displayImage(path: str, width: int, height: int, xPos: int, yPos: int):
-    image = Image.open(path)
-    image = image.resize((width, height))
+    from PIL import Image
 
-    rawData = image.tobytes("raw")
-    rawLen = len(rawData)
+    # Y8, the panel is grayscale so RGB would only triple the bytes blitted
+    with Image.open(imagePath) as image:
+        return image.convert("L").resize((width, height)).tobytes("raw")
 
+
+def loadSprite(imagePath: str, width: int, height: int) -> bytes:
+    key = (imagePath, width, height)
+    with _spriteCache.lock:
+        rawData = _spriteCache.sprites.get(key)
+        if rawData is not None:
+            _spriteCache.sprites.move_to_end(key)
+            _spriteCache.hits += 1
+            return rawData
+        _spriteCache.misses += 1
+
+    packKey = (os.path.basename(imagePath), width, height)
+    if _spritePack is not None and packKey in _spritePack.sprites:
+        offset, length = _spritePack.sprites[packKey]
+        rawData = _spritePack.buffer[offset:offset + length]
+    else:
+        start = spanStart()
+        rawData = renderSprite(imagePath, width, height)
+        spanEnd(Stage.SPRITE_DECODE, start)
+
+    with _spriteCache.lock:
+        _spriteCache.sprites[key] = rawData
+        while len(_spriteCache.sprites) > _spriteCache.maxEntries:
+            _spriteCache.sprites.popitem(last=False)
+            _spriteCache.evictions += 1
+
+    return rawData
+
+
+def getSpriteCacheStats() -> tuple[int, int, int]:
+    return (_spriteCache.hits, _spriteCache.misses, _spriteCache.evictions)
+
+
+def getGameLayout(game: Game) -> Layout:
+    screenWidth, screenHeight = getScreenSize()
+    return getLayout(screenWidth, screenHeight, game.maxX, game.maxY)
+
+
+def getLayoutSprites(layout: Layout) -> list[SpriteKey]:
+    cellSize = layout.cellSize
+    smileSize = layout.smileRect[2]
+    _, _, closeWidth, closeHeight = layout.closeIconRect
+    entries = [(name, cellSize, cellSize) for name in cellImages]
+    entries += [(name, layout.digitWidth, layout.digitHeight)
+                for name in dotDisplayImages + [DOT_DISPLAY_BLANK]]
+    entries += [(name, smileSize, smileSize) for name in smileImages]
+    entries.append((CLOSE_ICON, closeWidth, closeHeight))
+    return entries
+
+
+def buildAtlas(layout: Layout) -> SpriteAtlas:
+    cellSize = layout.cellSize
+    entries = getLayoutSprites(layout)
+
+    pack = _spritePack
+    sprites: dict[str, tuple[int, int, int, int]] = {}
+    if pack is not None and all(entry in pack.sprites for entry in entries):
+        # Blit straight out of the mapped pack, nothing to decode or copy
+        buffer = pack.buffer
+        for name, width, height in entries:
+            offset, length = pack.sprites[(name, width, height)]
+            sprites[name] = (offset, length, width, height)
+    else:
+        buffer = bytearray()
+        for name, width, height in entries:
+            rawData = loadSprite(f"{path}/assets/{name}", width, height)
+            sprites[name] = (len(buffer), len(rawData), width, height)
+            buffer += rawData
+
+    tileLines: list[list[bytes]] = [[] for _ in range(cellSize)]
+    for name in cellImages:
+        offset, length, _, _ = sprites[name]
+        lineLength = length // cellSize
+        for row in range(cellSize):
+            start = offset + row * lineLength
+            tileLines[row].append(bytes(buffer[start:start + lineLength]))
+
+    # The buffer must not be resized after this, the backend holds a view
+    data = _backend.wrapBuffer(buffer)
+    return SpriteAtlas(cellSize, buffer, data, sprites, tileLines)
+
+
+def getAtlas(layout: Layout) -> SpriteAtlas:
+    cellSize = layout.cellSize
+    with _atlasLock:
+        atlas = _atlases.get(cellSize)
+        if atlas is None:
+            atlas = buildAtlas(layout)
+            _atlases[cellSize] = atlas
+            while len(_atlases) > ATLAS_CACHE_SIZE:
+                _atlases.popitem(last=False)
+        _atlases.move_to_end(cellSize)
+    return atlas
+
+
+def preloadAtlas(maxX: int, maxY: int):
+    screenWidth, screenHeight = getScreenSize()
+    getAtlas(getLayout(screenWidth, screenHeight, maxX, maxY))
+
+
+def useAtlas(game: Game) -> SpriteAtlas:
+    global _currentAtlas
+    atlas = getAtlas(getGameLayout(game))
+    _currentAtlas = atlas
+    return atlas
+
+
+def mergeDamage(rects: list[tuple[int, int, int, int]], gap: int) -> list[tuple[int, int, int, int]]:
+    merged: list[tuple[int, int, int, int]] = []
+    for rect in rects:
+        left, top, right, bottom = rect
+        i = 0
+        while i < len(merged):
+            otherLeft, otherTop, otherRight, otherBottom = merged[i]
+            if (left <= otherRight + gap and otherLeft <= right + gap and
+                    top <= otherBottom + gap and otherTop <= bottom + gap):
+                # Grown rect may now touch ones already checked, so rescan
+                left = min(left, otherLeft)
+                top = min(top, otherTop)
+                right = max(right, otherRight)
+                bottom = max(bottom, otherBottom)
+                merged.pop(i)
+                i = 0
+                continue
+            i += 1
+        merged.append((left, top, right, bottom))
+
+    if len(merged) > DAMAGE_MAX_REGIONS:
+        merged = [(min(r[0] for r in merged), min(r[1] for r in merged),
+                   max(r[2] for r in merged), max(r[3] for r in merged))]
+
+    return merged
+
+
+def addDamage(xPos: int, yPos: int, width: int, height: int, kind: str = UpdateKind.FAST):
+    screenWidth, screenHeight = getScreenSize()
+    left = max(0, xPos)
+    top = max(0, yPos)
+    right = min(screenWidth, xPos + width)
+    bottom = min(screenHeight, yPos + height)
+    if right <= left or bottom <= top:
+        return
+    with _damage.lock:
+        _damage.rects.setdefault(kind, []).append((left, top, right, bottom))
+
+
+def printRawData(data, width: int, height: int, length: int, xPos: int, yPos: int, kind: str = UpdateKind.FAST, offset: int = 0):
+    start = spanStart()
     try:
-        FBInk.fbink_print_raw_data(
-            fbfd, rawData, width, height, rawLen, xPos, yPos, fbink_cfg)
+        _backend.printRawData(data, offset, width, height,
+                              length, xPos, yPos)
     except Exception as e:
         print("Fails to draw: ", e)
+        return
+    spanEnd(Stage.BLIT, start)
+    addDamage(xPos, yPos, width, height, kind)
+
+
+def blitSprite(atlas: SpriteAtlas, name: str, xPos: int, yPos: int, kind: str = UpdateKind.FAST):
+    offset, length, width, height = atlas.sprites[name]
+    printRawData(atlas.data, width, height,
+                 length, xPos, yPos, kind, offset)
+
 
+def displayImage(path: str, width: int, height: int, xPos: int, yPos: int, kind: str = UpdateKind.FAST):
+    rawData = loadSprite(path, width, height)
+    printRawData(rawData, width, height, len(rawData), xPos, yPos, kind)
 
-def drawDotDisplay(number: int, position: str):
-    yPadding = 120
-    xPadding = 50
-    screenWidth, _ = getScreenSize()
 
-    digitHeight = math.floor(screenWidth / 10)
-    digitWidth = math.floor(digitHeight / 2)
+def drawSprite(name: str, width: int, height: int, xPos: int, yPos: int, kind: str = UpdateKind.FAST):
+    atlas = _currentAtlas
+    if atlas is not None and name in atlas.sprites:
+        blitSprite(atlas, name, xPos, yPos, kind)
+        return
+    displayImage(f"{path}/assets/{name}", width,
+                 height, xPos, yPos, kind)
+
+
+def drawDotDisplay(layout: Layout, number: int, position: str):
+    digitWidth = layout.digitWidth
+    digitHeight = layout.digitHeight
 
     number = max(-99, min(number, 999))
 
     string = str(number)
     offset = 3 - len(string)
 
-    xStart = xPadding
+    rect = layout.flagCountRect
     if position == "right":
-        xStart = screenWidth - xPadding - (digitWidth*3)
+        rect = layout.timerRect
+    xStart, yPos, _, _ = rect
 
+    digits: list[str] = []
     for i in range(3):
+        imageName = dotDisplayImages[0]
         if i >= offset:
             subStr = string[i-offset]
             if subStr == "-":
-                imagePath = f"{path}/assets/number_blank.png"
-                displayImage(imagePath, digitWidth,
-                             digitHeight, xStart, yPadding)
+                imageName = DOT_DISPLAY_BLANK
             else:
-                imagePath = f"{path}/assets/{dotDisplayImages[int(subStr)]}"
-                displayImage(imagePath, digitWidth,
-                             digitHeight, xStart, yPadding)
-        else:
-            imagePath = f"{path}/assets/{dotDisplayImages[0]}"
-            displayImage(imagePath, digitWidth, digitHeight, xStart, yPadding)
-        xStart += digitWidth
+                imageName = dotDisplayImages[int(subStr)]
+        digits.append(imageName)
+
+    # Only digits that differ from what is on screen are blitted, so a
+    # ticking timer usually costs one digit
+    shown = _dotDisplays.get(position)
+    if shown is None or shown.rect != rect:
+        shown = DotDisplayState(rect, [""] * 3)
+        _dotDisplays[position] = shown
+    for i, imageName in enumerate(digits):
+        if shown.digits[i] != imageName:
+            drawSprite(imageName, digitWidth, digitHeight,
+                       xStart + i * digitWidth, yPos)
+            shown.digits[i] = imageName
+    autoRefresh()
 
 
 def drawSmile(game: Game):
-    yPadding = 120
-    screenWidth, _ = getScreenSize()
-
-    smileSize = math.floor(screenWidth / 10)
-    xPos = math.floor(screenWidth / 2 - (smileSize/2))
+    xPos, yPos, smileSize, _ = getGameLayout(game).smileRect
 
-    smilePath = f"{path}/assets/smiley_play.png"
+    smileName = "smiley_play.png"
 
     if game.gameOver:
         if game.hitMine:
-            smilePath = f"{path}/assets/smiley_dead.png"
+            smileName = "smiley_dead.png"
         else:
-            smilePath = f"{path}/assets/smiley_win.png"
+            smileName = "smiley_win.png"
 
-    game.smileRect = (xPos, xPos + smileSize, yPadding, yPadding + smileSize)
+    drawSprite(smileName, smileSize, smileSize,
+               xPos, yPos, UpdateKind.QUALITY)
+    autoRefresh()
 
-    displayImage(smilePath, smileSize, smileSize, xPos, yPadding)
 
+def drawCell(game: Game, index: int):
+    imageName = getCellImage(game, index)
 
-def drawCell(game: Game, cell: Cell):
-    imageName = getCellImage(cell)
+    layout = getGameLayout(game)
+    cellSize = layout.cellSize
+    xOrigin, yOrigin, _, _ = layout.boardRect
 
-    screenWidth, screenHeight = getScreenSize()
-
-    xPadding = 50
-    yPadding = 60
-    cellSize = (math.floor(screenWidth / game.maxX) -
-                (math.floor(xPadding*2 / game.maxX)))
+    cellX, cellY = getCellPosition(game, index)
+    x = cellX * cellSize + xOrigin
+    y = cellY * cellSize + yOrigin
 
-    boardYSize = cellSize * game.maxY
-    yDiff = screenHeight - boardYSize
+    drawSprite(imageName, cellSize, cellSize, x, y)
+    autoRefresh()
 
-    cellImagePath = f"{path}/assets/{imageName}"
 
-    x = cell.x * cellSize + xPadding
-    y = cell.y * cellSize + math.floor(yDiff / 2) + yPadding
+def composeCells(game: Game, atlas: SpriteAtlas, rect: Rect) -> bytes:
+    # One tile index per cell, row by row, then every pixel row is gathered
+    # from the matching tile rows in a single join
+    board = game.board
+    maxX = game.maxX
+    x, y, width, height = rect
+    tileRows = [board[start:start + width].translate(cellStateTiles)
+                for start in range(y * maxX + x, (y + height) * maxX, maxX)]
+    lines: list[bytes] = []
+    for tileRow in tileRows:
+        for tileLine in atlas.tileLines:
+            lines.append(b"".join(map(tileLine.__getitem__, tileRow)))
+    return b"".join(lines)
 
-    cell.screenX = x
-    cell.screenY = y
-    cell.size = cellSize
 
-    displayImage(cellImagePath, cellSize, cellSize, x, y)
+def drawCellRects(game: Game, rects: list[Rect], kind: str = UpdateKind.FAST):
+    atlas = useAtlas(game)
+    cellSize = atlas.cellSize
+    xOrigin, yOrigin, _, _ = getGameLayout(game).boardRect
 
+    for rect in rects:
+        x, y, width, height = rect
+        rawData = composeCells(game, atlas, rect)
+        printRawData(rawData, width * cellSize, height * cellSize, len(rawData),
+                     xOrigin + x * cellSize, yOrigin + y * cellSize, kind)
+    autoRefresh()
 
-def drawCellsBatch(game: Game, cells: list[Cell]):
-    disableRefresh()
-    for i, cell in enumerate(cells):
-        if i % 20 == 0:
-            refreshScreen()
-        drawCell(game, cell)
 
-    enableRefresh()
-    refreshScreen()
+def drawBoardCells(game: Game):
+    drawCellRects(game, [(0, 0, game.maxX, game.maxY)], UpdateKind.QUALITY)
 
 
-def drawTimer(number: int):
-    drawDotDisplay(number, "right")
+def drawTimer(game: Game, number: int):
+    drawDotDisplay(getGameLayout(game), number, "right")
 
 
-def drawFlagCount(number: int):
-    drawDotDisplay(number, "left")
+def drawFlagCount(game: Game, number: int):
+    drawDotDisplay(getGameLayout(game), number, "left")
 
 
-def drawCloseIcon():
-    closePath = f"{path}/assets/close.jpg"
-    displayImage(closePath, 60, 60, 0, 0)
+def drawCloseIcon(game: Game):
+    xPos, yPos, width, height = getGameLayout(game).closeIconRect
+    drawSprite(CLOSE_ICON, width, height, xPos, yPos, UpdateKind.QUALITY)
+    autoRefresh()
 
 
 def getScreenSize() -> tuple[int, int]:
-    return (state.screen_width, state.screen_height)
+    return _backend.getScreenSize()
+
+
+def setRefreshPolicy(fastWaveform: str, qualityWaveform: str, fullRefreshEvery: int):
+    _refreshPolicy.fastWaveform = fastWaveform
+    _refreshPolicy.qualityWaveform = qualityWaveform
+    _refreshPolicy.fullRefreshEvery = fullRefreshEvery
+    _refreshPolicy.partialRefreshes = 0
+
+
+def getWaveform(kind: str) -> str:
+    if kind == UpdateKind.QUALITY:
+        return _refreshPolicy.qualityWaveform
+    return _refreshPolicy.fastWaveform
 
 
 def refreshScreen():
-    FBInk.fbink_refresh(fbfd, 0, 0, 0, 0, fbink_cfg)
+    with _damage.lock:
+        rects = _damage.rects
+        _damage.rects = {}
+    if not rects:
+        return
+
+    start = spanStart()
+    _refreshDamage(rects)
+    spanEnd(Stage.REFRESH, start)
+
+
+def _refreshDamage(rects: dict[str, list[tuple[int, int, int, int]]]):
+    regions = [(kind, region) for kind, kindRects in rects.items()
+               for region in mergeDamage(kindRects, DAMAGE_MERGE_GAP)]
+    screenWidth, screenHeight = getScreenSize()
+    damagedArea = sum((right - left) * (bottom - top)
+                      for _, (left, top, right, bottom) in regions)
+    if damagedArea >= screenWidth * screenHeight * DAMAGE_FULL_SCREEN_RATIO:
+        refreshFullScreen()
+        return
+
+    policy = _refreshPolicy
+    if policy.fullRefreshEvery > 0 and policy.partialRefreshes + len(regions) >= policy.fullRefreshEvery:
+        # Clear accumulated ghosting instead of stacking more partials
+        refreshFullScreen(flashing=True)
+        return
+
+    for kind, (left, top, right, bottom) in regions:
+        _backend.refresh(top, left, right - left, bottom - top,
+                         getWaveform(kind), False)
+    policy.partialRefreshes += len(regions)
+
+
+def refreshFullScreen(flashing: bool = False):
+    with _damage.lock:
+        _damage.rects.clear()
+    _backend.refresh(0, 0, 0, 0, getWaveform(UpdateKind.QUALITY), flashing)
+    if flashing:
+        _refreshPolicy.partialRefreshes = 0
+
+
+def autoRefresh():
+    if _damage.autoRefresh:
+        refreshScreen()
 
 
 def disableRefresh():
-    fbink_cfg.no_refresh = True
+    _damage.autoRefresh = False
 
 
 def enableRefresh():
-    fbink_cfg.no_refresh = False
+    _damage.autoRefresh = True
 
 
 def closeDraw():
     refreshScreen()
-    FBInk.fbink_close(fbfd)
+    _backend.close()
 
 
-def initDraw():
+def initDraw(backend: Optional[RenderBackend] = None):
+    global _backend
+    if backend is None:
+        backend = FBInkBackend()
+    _backend = backend
+    loadSpritePack(f"{path}/assets/{PACK_NAME}")
+
+
+def loadSpritePack(packPath: str):
+    global _spritePack
+    pack = openSpritePack(packPath)
+    if pack is not None and (pack.screenWidth, pack.screenHeight) != getScreenSize():
+        print(f"{packPath} was built for {pack.screenWidth}x{pack.screenHeight}, "
+              "decoding sprites instead")
+        pack = None
+    _spritePack = pack
+
+
+def clearScreen():
+    _dotDisplays.clear()
     screenWidth, screenHeight = getScreenSize()
-    background = Image.new(mode="RGB", size=(
-        screenWidth, screenHeight), color=(255, 255, 255))
-    backgroundRaw = background.tobytes("raw")
+    # White Y8, a third of the bytes of an RGB clear
+    backgroundRaw = b"\xff" * (screenWidth * screenHeight)
 
     try:
-        FBInk.fbink_print_raw_data(fbfd, backgroundRaw, background.width, background.height, len(
-            backgroundRaw), 0, 0, fbink_cfg)
+        _backend.printRawData(backgroundRaw, 0, screenWidth, screenHeight,
+                              len(backgroundRaw), 0, 0)
     except Exception as e:
-        print("initDraw: ", e)
-        FBInk.fbink_close(fbfd)
-
-
-fbfd = FBInk.fbink_open()
-FBInk.fbink_init(fbfd, fbink_cfg)
-state = ffi.new("FBInkState *")
-FBInk.fbink_get_state(fbink_cfg, state)
+        print("clearScreen: ", e)
+        return
+    refreshFullScreen(flashing=True)
@@ -0,0 +1,387 @@
+from common import Game, CELL_NUMBER, CELL_MINE, CELL_OPEN, CELL_FLAG, CELL_MARKED
+from dataclasses import dataclass, field
+from layout import Rect
+from random import Random
+from stack import Stack
+from topology import NeighbourTable, TopologyName, getNeighbourTable
+from typing import Final, Optional
+import math
+import re
+import time
+
+# (y, xStart, xEnd) run of cells in one row, xEnd exclusive
+Span = tuple[int, int, int]
+
+ZERO_RUN: Final = re.compile(b"\x00+")
+# Closed, unflagged, non-mine cells are exactly the bytes 0 to 8
+OPENABLE_CELL: Final = re.compile(b"[\x00-\x08]")
+
+# Random draws before pickFreeCell lists the free cells instead
+FREE_CELL_ATTEMPTS: Final[int] = 64
+
+
+@dataclass
+class BoardUpdate:
+    # Cells whose picture changed, in cell units
+    rects: list[Rect] = field(default_factory=list)
+    flagsChanged: bool = False
+    gameEnded: bool = False
+
+
+def sampleMines(cellCount: int, mineCount: int, rng: Random) -> list[int]:
+    # Sampling from a range keeps memory proportional to the mine count
+    return rng.sample(range(cellCount), min(mineCount, cellCount))
+
+
+def countNeighbourMines(maxX: int, maxY: int, mines: list[int]) -> bytearray:
+    # The mine mask is padded with an empty border and read as one big
+    # integer with a byte per cell. Summing shifted copies adds up each 3x3
+    # neighbourhood for every cell at once, counts never exceed 9 so no
+    # byte carries into the next
+    stride = maxX + 2
+    mask = bytearray(stride * (maxY + 2))
+    for index in mines:
+        y, x = divmod(index, maxX)
+        mask[(y + 1) * stride + x + 1] = 1
+
+    cells = int.from_bytes(mask, "little")
+    rows = cells + (cells << 8) + (cells >> 8)
+    rowBits = stride * 8
+    counts = rows + (rows << rowBits) + (rows >> rowBits) - cells
+    countBytes = counts.to_bytes(len(mask) + stride + 1, "little")
+
+    return bytearray(b"".join(
+        countBytes[start:start + maxX]
+        for start in range(stride + 1, stride * (maxY + 1), stride)))
+
+
+def countNeighbourMinesWithTable(table: NeighbourTable, cellCount: int, mines: list[int]) -> bytearray:
+    board = bytearray(cellCount)
+    cellClass = table.cellClass
+    deltas = table.deltas
+    for index in mines:
+        for delta in deltas[cellClass[index]]:
+            board[index + delta] += 1
+    return board
+
+
+def pickFreeCell(game: Game, excluded: set[int]) -> Optional[int]:
+    # Cells are uniform, so redrawing until a free one comes up is a uniform
+    # pick among free cells. Only near-full boards fall back to listing them
+    board = game.board
+    rng = game.random
+    for _ in range(FREE_CELL_ATTEMPTS):
+        index = rng.randrange(len(board))
+        if not board[index] & CELL_MINE and index not in excluded:
+            return index
+
+    freeCells = [index for index in range(len(board))
+                 if not board[index] & CELL_MINE and index not in excluded]
+    if not freeCells:
+        return None
+    return rng.choice(freeCells)
+
+
+def moveMine(game: Game, index: int, excluded: set[int]) -> bool:
+    newIndex = pickFreeCell(game, excluded)
+    if newIndex is None:
+        return False
+
+    board = game.board
+    cellClass = game.neighbours.cellClass
+    deltas = game.neighbours.deltas
+    board[index] &= ~CELL_MINE
+    for delta in deltas[cellClass[index]]:
+        board[index + delta] -= 1
+    board[newIndex] |= CELL_MINE
+    for delta in deltas[cellClass[newIndex]]:
+        board[newIndex + delta] += 1
+
+    game.mines.discard(index)
+    game.mines.add(newIndex)
+    return True
+
+
+def clearFirstClick(game: Game, index: int):
+    board = game.board
+    zone = {index}
+    if game.safeZone:
+        zone.update(index + delta
+                    for delta in game.neighbours.deltas[game.neighbours.cellClass[index]])
+
+    if board[index] & CELL_MINE and not moveMine(game, index, zone):
+        # Not enough room to keep the whole zone clear, only the tap matters
+        moveMine(game, index, {index})
+        return
+
+    for cell in sorted(zone):
+        if cell != index and board[cell] & CELL_MINE:
+            moveMine(game, cell, zone)
+
+
+def getSpanRects(spans: list[Span]) -> list[Rect]:
+    # Joins touching spans in a row, then stacks equal spans of consecutive
+    # rows into rectangles, all in cell units
+    spans.sort()
+    rowSpans: list[Span] = []
+    for y, start, end in spans:
+        if rowSpans and rowSpans[-1][0] == y and rowSpans[-1][2] == start:
+            rowSpans[-1] = (y, rowSpans[-1][1], end)
+        else:
+            rowSpans.append((y, start, end))
+
+    rects: list[Rect] = []
+    lastRect: dict[tuple[int, int], int] = {}
+    for y, start, end in rowSpans:
+        i = lastRect.get((start, end))
+        if i is not None and rects[i][1] + rects[i][3] == y:
+            x, rectY, width, height = rects[i]
+            rects[i] = (x, rectY, width, height + 1)
+        else:
+            lastRect[(start, end)] = len(rects)
+            rects.append((start, y, end - start, 1))
+    return rects
+
+
+def openScanline(game: Game, index: int) -> tuple[int, list[Span]]:
+    board = game.board
+    maxX = game.maxX
+    maxY = game.maxY
+    # A closed zero cell is the byte 0, so opening one writes CELL_OPEN
+    openRow = memoryview(bytes([CELL_OPEN]) * maxX)
+    spans: list[Span] = []
+    opened = 0
+
+    y, x = divmod(index, maxX)
+    windows: list[Span] = [(y, x, x + 1)]
+    while windows:
+        y, start, end = windows.pop()
+        rowStart = y * maxX
+        rowEnd = rowStart + maxX
+        pos = rowStart + start
+        windowEnd = rowStart + end
+        while True:
+            match = OPENABLE_CELL.search(board, pos, windowEnd)
+            if match is None:
+                break
+            pos = match.start()
+            if board[pos]:
+                board[pos] |= CELL_OPEN
+                opened += 1
+                spans.append((y, pos - rowStart, pos - rowStart + 1))
+                pos += 1
+                continue
+
+            runStart = pos
+            while runStart > rowStart and board[runStart - 1] == 0:
+                runStart -= 1
+            runEnd = ZERO_RUN.match(board, pos, rowEnd).end()
+            board[runStart:runEnd] = openRow[:runEnd - runStart]
+            opened += runEnd - runStart
+
+            spanStart = runStart - rowStart
+            spanEnd = runEnd - rowStart
+            if spanStart > 0 and board[runStart - 1] <= CELL_NUMBER:
+                board[runStart - 1] |= CELL_OPEN
+                opened += 1
+                spanStart -= 1
+            if spanEnd < maxX and board[runEnd] <= CELL_NUMBER:
+                board[runEnd] |= CELL_OPEN
+                opened += 1
+                spanEnd += 1
+            spans.append((y, spanStart, spanEnd))
+
+            windowStart = max(runStart - rowStart - 1, 0)
+            windowStop = min(runEnd - rowStart + 1, maxX)
+            if y > 0:
+                windows.append((y - 1, windowStart, windowStop))
+            if y < maxY - 1:
+                windows.append((y + 1, windowStart, windowStop))
+            pos = runEnd
+
+    return (opened, spans)
+
+
+def openWithTable(game: Game, index: int) -> tuple[int, list[Span]]:
+    board = game.board
+    maxX = game.maxX
+    cellClass = game.neighbours.cellClass
+    deltas = game.neighbours.deltas
+    myStack = Stack()
+    board[index] |= CELL_OPEN
+    myStack.push(index)
+    y, x = divmod(index, maxX)
+    spans: list[Span] = [(y, x, x + 1)]
+    while myStack.size() > 0:
+        poppedIndex = myStack.pop()
+
+        for delta in deltas[cellClass[poppedIndex]]:
+            neighbour = poppedIndex + delta
+            state = board[neighbour]
+            if not state & (CELL_FLAG | CELL_OPEN):
+                board[neighbour] = state | CELL_OPEN
+                if state & CELL_NUMBER == 0:
+                    myStack.push(neighbour)
+                y, x = divmod(neighbour, maxX)
+                spans.append((y, x, x + 1))
+    return (len(spans), spans)
+
+
+def openMultiple(game: Game, index: int) -> tuple[int, list[Span]]:
+    if game.neighbours.name == TopologyName.GRID:
+        return openScanline(game, index)
+    return openWithTable(game, index)
+
+
+def endGame(game: Game, won: bool, spans: list[Span]):
+    # Only cells whose picture changes are touched, so the cost follows the
+    # number of mines and flags rather than the board size
+    game.gameOver = True
+    board = game.board
+    changed: list[int] = []
+    if not won:
+        game.hitMine = True
+        for index in game.mines:
+            if board[index] & CELL_FLAG:
+                continue
+            board[index] |= CELL_OPEN
+            changed.append(index)
+        for index in game.flags:
+            if not board[index] & CELL_MINE:
+                board[index] |= CELL_MARKED
+                changed.append(index)
+
+    else:
+        for index in game.mines:
+            if not board[index] & CELL_FLAG:
+                board[index] |= CELL_FLAG
+                game.flags.add(index)
+                changed.append(index)
+        game.flagsPlaced = len(game.flags)
+
+    maxX = game.maxX
+    for index in changed:
+        y, x = divmod(index, maxX)
+        spans.append((y, x, x + 1))
+
+
+def checkWin(game: Game) -> bool:
+    if game.gameOver:
+        return False
+    return game.nonMineCellsOpened >= (game.maxX * game.maxY) - game.minesCount
+
+
+def getElapsedSeconds(game: Game) -> int:
+    if game.startTime == 0:
+        return 0
+    return math.floor(((time.time() * 1000) - game.startTime) / 1000)
+
+
+def clearHint(game: Game, spans: list[Span]):
+    # The hint mark has to go before the board is changed, fills and
+    # neighbour counts expect hidden cells to hold nothing but their number
+    if game.hint == -1:
+        return
+    game.board[game.hint] &= ~CELL_MARKED
+    y, x = divmod(game.hint, game.maxX)
+    spans.append((y, x, x + 1))
+    game.hint = -1
+
+
+def showHint(game: Game, index: int) -> BoardUpdate:
+    spans: list[Span] = []
+    clearHint(game, spans)
+    if not game.board[index] & (CELL_OPEN | CELL_FLAG):
+        game.board[index] |= CELL_MARKED
+        game.hint = index
+        y, x = divmod(index, game.maxX)
+        spans.append((y, x, x + 1))
+    return BoardUpdate(getSpanRects(spans))
+
+
+def flagCell(game: Game, index: int) -> BoardUpdate:
+    update = BoardUpdate()
+    spans: list[Span] = []
+    clearHint(game, spans)
+    state = game.board[index]
+    if state & CELL_FLAG:
+        game.board[index] = state & ~CELL_FLAG
+        game.flags.discard(index)
+        game.flagsPlaced -= 1
+    else:
+        if state & CELL_OPEN:
+            update.rects = getSpanRects(spans)
+            return update
+        game.board[index] = state | CELL_FLAG
+        game.flags.add(index)
+        game.flagsPlaced += 1
+
+    y, x = divmod(index, game.maxX)
+    spans.append((y, x, x + 1))
+    update.rects = getSpanRects(spans)
+    update.flagsChanged = True
+    return update
+
+
+def openCell(game: Game, index: int) -> BoardUpdate:
+    update = BoardUpdate()
+    board = game.board
+    spans: list[Span] = []
+    clearHint(game, spans)
+    if game.clicks == 0:
+        clearFirstClick(game, index)
+    if game.startTime == 0:
+        game.startTime = int(time.time() * 1000)
+
+    state = board[index]
+    if not state & (CELL_FLAG | CELL_OPEN):
+        if state & CELL_MINE:
+            board[index] = state | CELL_OPEN | CELL_MARKED
+            endGame(game, False, spans)
+            update.gameEnded = True
+        elif state & CELL_NUMBER == 0:
+            opened, openedSpans = openMultiple(game, index)
+            game.nonMineCellsOpened += opened
+            spans += openedSpans
+        else:
+            board[index] = state | CELL_OPEN
+            game.nonMineCellsOpened += 1
+            y, x = divmod(index, game.maxX)
+            spans.append((y, x, x + 1))
+
+    game.clicks += 1
+    if checkWin(game):
+        endGame(game, True, spans)
+        update.gameEnded = True
+        update.flagsChanged = True
+
+    update.rects = getSpanRects(spans)
+    return update
+
+
+def createGame(x: int, y: int, mines: int, seed: Optional[int] = None, topology: str = TopologyName.GRID, safeZone: bool = False):
+    rng = Random(seed)
+    cellsWithMines = sampleMines(x * y, mines, rng)
+    return createGameWithMines(x, y, cellsWithMines, rng, topology, safeZone)
+
+
+def createGameFromLayout(x: int, y: int, cellsWithMines: list[int], start: int, seed: Optional[int] = None) -> Game:
+    # Boards from the no-guess pool come with the cell they were checked
+    # from already open, the clock starts with the player's first tap
+    game = createGameWithMines(x, y, cellsWithMines, Random(seed))
+    openCell(game, start)
+    game.startTime = 0
+    return game
+
+
+def createGameWithMines(x: int, y: int, cellsWithMines: list[int], rng: Random, topology: str = TopologyName.GRID, safeZone: bool = False):
+    neighbours = getNeighbourTable(topology, x, y)
+    if neighbours.name == TopologyName.GRID:
+        board = countNeighbourMines(x, y, cellsWithMines)
+    else:
+        board = countNeighbourMinesWithTable(
+            neighbours, x * y, cellsWithMines)
+    for index in cellsWithMines:
+        board[index] |= CELL_MINE
+    return Game(board, x, y, len(cellsWithMines), neighbours,
+                mines=set(cellsWithMines), safeZone=safeZone, random=rng)
@@ -1,9 +1,12 @@
+import os
+import select
 import struct
 import time
 import threading
 from dataclasses import dataclass, field
 from typing import Callable, Final, Optional
 from grabInput import grab, ungrab
+from profiler import Stage, spanStart, spanEnd
 
 # struct input_event {
 #        struct timeval time; = {long seconds, long microseconds}
@@ -12,12 +15,29 @@ from grabInput import grab, ungrab
 #        unsigned int value;
 # };
 FORMAT: Final[str] = 'llHHI'
-EVENT_SIZE: Final[int] = struct.calcsize(FORMAT)
+EVENT_STRUCT: Final[struct.Struct] = struct.Struct(FORMAT)
+EVENT_SIZE: Final[int] = EVENT_STRUCT.size
+
+# Events drained per read, a touch burst is rarely more than a few dozen
+READ_EVENTS: Final[int] = 64
+# The input thread wakes this often to notice closeKoboInput
+POLL_TIMEOUT_MS: Final[int] = 250
 
 TOUCH_PATH: Final[str] = "/dev/input/event1"
 
+# Recordings start with this header and the board the session was played
+# on, followed by raw input_event structs exactly as read from the device,
+# kernel timestamps included
+RECORD_MAGIC: Final[bytes] = b"KOBOEVT2"
+RECORD_HEADER: Final[struct.Struct] = struct.Struct('<8sH')
+# (seed, x, y, mines, topology, safeZone)
+RECORD_BOARD: Final[struct.Struct] = struct.Struct('<qHHI8s?')
+
 NOT_INIT_MESSAGE: Final[str] = "Kobo input has not been initialized"
 
+# How long closeKoboInput waits for the input thread to finish
+CLOSE_TIMEOUT_S: Final[float] = 1.0
+
 
 @dataclass
 class EventType:
@@ -75,16 +95,30 @@ class KoboInput:
     onTouchMove: list[Callable[[int, int], None]] = field(default_factory=list)
     onSwipe: list[Callable[[str, int, int, int, int], None]
                   ] = field(default_factory=list)
-    eventFile = open(TOUCH_PATH, "rb")
+    thread: Optional[threading.Thread] = None
+    eventFd: int = -1
+    # Trailing bytes of a read that did not hold a whole event
+    pendingBytes: bytes = b""
+    recordFd: int = -1
+    replayPath: Optional[str] = None
+    # Replay with the recorded delays, otherwise as fast as possible
+    replayRealtime: bool = True
+    onReplayEnd: Optional[Callable[[], None]] = None
 
 
 @dataclass
-class Event:
-    timeSeconds: int = 0
-    timeMicroSeconds: int = 0
-    eventType: int = 0
-    code: int = 0
-    value: int = 0
+class RecordedBoard:
+    # Everything createGame needs to deal the same board again
+    seed: int
+    x: int
+    y: int
+    mines: int
+    topology: str
+    safeZone: bool
+
+
+# (timeSeconds, timeMicroSeconds, eventType, code, value)
+Event = tuple[int, int, int, int, int]
 
 
 _koboInputObject: Optional[KoboInput] = None
@@ -110,24 +144,32 @@ def _getSwipeDirection(koboInput: KoboInput) -> Optional[str]:
             return SwipeDirection.UP
 
 
-def _getEvent() -> Optional[Event]:
-    if _koboInputObject is None:
-        return None
-    eventBytes: Optional[bytes] = None
+def _readEvents(koboInput: KoboInput) -> bytes:
     try:
-        eventBytes = _koboInputObject.eventFile.read(EVENT_SIZE)
-    except:
-        return None
-    if not eventBytes:
-        return None
-    unPackedEvent = struct.unpack(FORMAT, eventBytes)
-    if not unPackedEvent:
-        return None
-
-    return Event(*unPackedEvent)
+        data = os.read(koboInput.eventFd, EVENT_SIZE * READ_EVENTS)
+    except (BlockingIOError, InterruptedError):
+        return b""
+    if koboInput.pendingBytes:
+        data = koboInput.pendingBytes + data
+    usable = len(data) - len(data) % EVENT_SIZE
+    koboInput.pendingBytes = data[usable:]
+    return data[:usable]
+
+
+def _processEvents(koboInput: KoboInput, data: bytes, packet: list[Event]):
+    for event in EVENT_STRUCT.iter_unpack(data):
+        eventType = event[2]
+        if eventType == EventType.EV_SYS and event[3] == EventCode.SYN_DROPPED:
+            # Bad packet, discard
+            packet.clear()
+        packet.append(event)
+        if eventType == EventType.EV_SYS:
+            _readPacket(koboInput, packet)
+            packet.clear()
 
 
 def _readPacket(koboInput: KoboInput, packet: list[Event]):
+    start = spanStart()
     x: Optional[int] = None
     y: Optional[int] = None
     translatedX: Optional[int] = None
@@ -135,22 +177,26 @@ def _readPacket(koboInput: KoboInput, packet: list[Event]):
     touchStart = False
     touchEnd = False
     moveUpdated = False
-    for event in packet:
-        if event.eventType == EventType.EV_KEY and event.code == EventCode.BTN_TOUCH:
-            if event.value == 1 and not koboInput.isTouching:
+    # Gestures are timed with the kernel timestamp of the packet so replays
+    # classify taps and holds exactly like the recorded session
+    seconds, microSeconds = packet[-1][0], packet[-1][1]
+    packetTimeMs = seconds * 1000 + microSeconds // 1000
+    for _, _, eventType, code, value in packet:
+        if eventType == EventType.EV_KEY and code == EventCode.BTN_TOUCH:
+            if value == 1 and not koboInput.isTouching:
                 touchStart = True
                 koboInput.isTouching = True
-                koboInput.touchStartTime = int(time.time() * 1000)
-            elif event.value == 0 and koboInput.isTouching:
+                koboInput.touchStartTime = packetTimeMs
+            elif value == 0 and koboInput.isTouching:
                 touchEnd = True
                 koboInput.isTouching = False
-        if event.eventType == EventType.EV_ABS:
-            if event.code == EventCode.ABS_MT_POSITION_X:
+        if eventType == EventType.EV_ABS:
+            if code == EventCode.ABS_MT_POSITION_X:
                 moveUpdated = True
-                x = event.value
-            if event.code == EventCode.ABS_MT_POSITION_Y:
+                x = value
+            if code == EventCode.ABS_MT_POSITION_Y:
                 moveUpdated = True
-                y = event.value
+                y = value
 
     # Rotate coordinates
     if x:
@@ -164,6 +210,8 @@ def _readPacket(koboInput: KoboInput, packet: list[Event]):
     if translatedX:
         koboInput.currentX = translatedX
 
+    spanEnd(Stage.INPUT_DECODE, start)
+
     if touchStart:
         koboInput.touchStartX = koboInput.currentX
         koboInput.touchStartY = koboInput.currentY
@@ -171,22 +219,22 @@ def _readPacket(koboInput: KoboInput, packet: list[Event]):
             func(koboInput.currentX, koboInput.currentY)
 
     if touchEnd:
-        timeDiff = int(time.time() * 1000) - \
-            koboInput.touchStartTime
+        timeDiff = packetTimeMs - koboInput.touchStartTime
         for func in koboInput.onTouchEnd:
             func(koboInput.currentX, koboInput.currentY)
-        if timeDiff < koboInput.holdDelayMs:
-            for func in koboInput.onTap:
-                func(koboInput.currentX, koboInput.currentY)
-        else:
-            for func in koboInput.onHoldEnd:
-                func(koboInput.currentX, koboInput.currentY, timeDiff)
 
+        # A swipe is not also a tap or hold where the finger lifted
         swipeDirection = _getSwipeDirection(koboInput)
         if swipeDirection is not None:
             for func in koboInput.onSwipe:
                 func(swipeDirection, koboInput.touchStartX,
                      koboInput.touchStartY, koboInput.currentX, koboInput.currentY)
+        elif timeDiff < koboInput.holdDelayMs:
+            for func in koboInput.onTap:
+                func(koboInput.currentX, koboInput.currentY)
+        else:
+            for func in koboInput.onHoldEnd:
+                func(koboInput.currentX, koboInput.currentY, timeDiff)
 
     if moveUpdated:
         for func in koboInput.onTouchMove:
@@ -199,35 +247,125 @@ def closeKoboInput():
         print(NOT_INIT_MESSAGE)
         return
 
-    if _koboInputObject.grabInput:
-        ungrab(_koboInputObject.eventFile)
-    _koboInputObject.eventFile.close()
+    _koboInputObject.init = False
+    thread = _koboInputObject.thread
+    if thread is not None and thread is not threading.current_thread():
+        thread.join(CLOSE_TIMEOUT_S)
+
+    if _koboInputObject.eventFd != -1:
+        if _koboInputObject.grabInput:
+            ungrab(_koboInputObject.eventFd)
+        os.close(_koboInputObject.eventFd)
+        _koboInputObject.eventFd = -1
+    if _koboInputObject.recordFd != -1:
+        os.close(_koboInputObject.recordFd)
+        _koboInputObject.recordFd = -1
     _koboInputObject.onHoldEnd.clear()
     _koboInputObject.onSwipe.clear()
     _koboInputObject.onTap.clear()
     _koboInputObject.onTouchEnd.clear()
     _koboInputObject.onTouchMove.clear()
     _koboInputObject.onTouchStart.clear()
-    _koboInputObject.init = False
 
 
 def _task():
-    global _koboInputObject
-    if _koboInputObject is None:
+    koboInput = _koboInputObject
+    if koboInput is None:
         return
+    poller = select.poll()
+    poller.register(koboInput.eventFd, select.POLLIN)
     eventPacket: list[Event] = []
-    while _koboInputObject.init:
-        event = _getEvent()
-        if event is None:
+    while koboInput.init:
+        ready = poller.poll(POLL_TIMEOUT_MS)
+        if not ready:
             continue
+        _, mask = ready[0]
+        if mask & (select.POLLERR | select.POLLHUP | select.POLLNVAL):
+            print("Touch device is no longer readable")
+            return
+
+        data = _readEvents(koboInput)
+        if data:
+            if koboInput.recordFd != -1:
+                os.write(koboInput.recordFd, data)
+            _processEvents(koboInput, data, eventPacket)
+
+
+def _waitUntil(koboInput: KoboInput, deadline: float):
+    # Sleep in short steps so closeKoboInput is not held up by long pauses
+    while koboInput.init:
+        delay = deadline - time.monotonic()
+        if delay <= 0:
+            return
+        time.sleep(min(delay, POLL_TIMEOUT_MS / 1000))
+
+
+def _readRecording(path: str) -> Optional[tuple[RecordedBoard, bytes]]:
+    try:
+        with open(path, "rb") as file:
+            data = file.read()
+    except OSError as e:
+        print(f"Cannot read {path}: {e.strerror}")
+        return None
+    headerSize = RECORD_HEADER.size + RECORD_BOARD.size
+    if len(data) < headerSize:
+        print(f"{path} is not an input recording")
+        return None
+    magic, eventSize = RECORD_HEADER.unpack_from(data)
+    if magic != RECORD_MAGIC:
+        print(f"{path} is not an input recording")
+        return None
+    if eventSize != EVENT_SIZE:
+        print(f"{path} was recorded with {eventSize} byte events, "
+              f"this device uses {EVENT_SIZE}")
+        return None
+    seed, x, y, mines, topology, safeZone = RECORD_BOARD.unpack_from(
+        data, RECORD_HEADER.size)
+    board = RecordedBoard(seed, x, y, mines,
+                          topology.rstrip(b"\0").decode("ascii"), safeZone)
+    data = data[headerSize:]
+    return (board, data[:len(data) - len(data) % EVENT_SIZE])
+
+
+def readRecordedBoard(path: str) -> Optional[RecordedBoard]:
+    recording = _readRecording(path)
+    if recording is None:
+        return None
+    return recording[0]
 
-        if event.eventType == EventType.EV_SYS and event.code == EventCode.SYN_DROPPED:
-            # Bad packet, discard
-            eventPacket.clear()
-        eventPacket.append(event)
-        if event.eventType == EventType.EV_SYS:
-            _readPacket(_koboInputObject, eventPacket)
-            eventPacket.clear()
+
+def _replayTask():
+    koboInput = _koboInputObject
+    if koboInput is None or koboInput.replayPath is None:
+        return
+    recording = _readRecording(koboInput.replayPath)
+    data = b"" if recording is None else recording[1]
+
+    eventPacket: list[Event] = []
+    packetStart = 0
+    packets = 0
+    firstEventTime: Optional[float] = None
+    startTime = time.monotonic()
+    for index, event in enumerate(EVENT_STRUCT.iter_unpack(data)):
+        if event[2] != EventType.EV_SYS:
+            continue
+        if not koboInput.init:
+            break
+        if koboInput.replayRealtime:
+            eventTime = event[0] + event[1] / 1000000
+            if firstEventTime is None:
+                firstEventTime = eventTime
+            _waitUntil(koboInput, startTime + eventTime - firstEventTime)
+        # Hand over one packet at a time, the same path live reads take
+        packetEnd = (index + 1) * EVENT_SIZE
+        _processEvents(koboInput, data[packetStart:packetEnd], eventPacket)
+        packetStart = packetEnd
+        packets += 1
+
+    elapsed = time.monotonic() - startTime
+    print(f"Replayed {packets} packets in {elapsed:.3f}s")
+    if koboInput.init and koboInput.onReplayEnd is not None:
+        koboInput.onReplayEnd()
 
 
 def addKoboInputListener(name: str, func: Callable):
@@ -274,12 +412,52 @@ def getKoboInputObject():
     return _koboInputObject
 
 
-def initKoboInput(viewWidth: int, grabInput: bool = True):
+def startReplay():
+    if _koboInputObject is None:
+        print(NOT_INIT_MESSAGE)
+        return
+    if _koboInputObject.replayPath is None or _koboInputObject.thread is not None:
+        return
+    thread = threading.Thread(target=_replayTask)
+    _koboInputObject.thread = thread
+    thread.start()
+
+
+def initKoboInput(viewWidth: int, grabInput: bool = True,
+                  recordPath: Optional[str] = None,
+                  recordedBoard: Optional[RecordedBoard] = None,
+                  replayPath: Optional[str] = None,
+                  replayRealtime: bool = True,
+                  onReplayEnd: Optional[Callable[[], None]] = None):
     global _koboInputObject
     _koboInputObject = KoboInput(viewWidth=viewWidth, grabInput=grabInput)
 
+    if replayPath is not None:
+        # Replays never touch the device, startReplay begins playback once
+        # listeners are attached
+        _koboInputObject.replayPath = replayPath
+        _koboInputObject.replayRealtime = replayRealtime
+        _koboInputObject.onReplayEnd = onReplayEnd
+        return
+
+    _koboInputObject.eventFd = os.open(
+        TOUCH_PATH, os.O_RDONLY | os.O_NONBLOCK)
+
     if _koboInputObject.grabInput:
-        grab(_koboInputObject.eventFile)
+        grab(_koboInputObject.eventFd)
+
+    if recordPath is not None:
+        if recordedBoard is None:
+            raise ValueError("Recording needs the board being played")
+        _koboInputObject.recordFd = os.open(
+            recordPath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        os.write(_koboInputObject.recordFd,
+                 RECORD_HEADER.pack(RECORD_MAGIC, EVENT_SIZE)
+                 + RECORD_BOARD.pack(recordedBoard.seed, recordedBoard.x,
+                                     recordedBoard.y, recordedBoard.mines,
+                                     recordedBoard.topology.encode("ascii"),
+                                     recordedBoard.safeZone))
 
     thread = threading.Thread(target=_task)
+    _koboInputObject.thread = thread
     thread.start()
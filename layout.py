@@ -0,0 +1,72 @@
+from dataclasses import dataclass
+from functools import lru_cache
+import math
+
+# (x, y, width, height)
+Rect = tuple[int, int, int, int]
+
+BOARD_X_PADDING = 50
+BOARD_Y_PADDING = 60
+HUD_X_PADDING = 50
+HUD_Y_PADDING = 120
+CLOSE_ICON_SIZE = 60
+CLOSE_TOUCH_SIZE = 120
+
+
+@dataclass(frozen=True)
+class Layout:
+    screenWidth: int
+    screenHeight: int
+    maxX: int
+    maxY: int
+    cellSize: int
+    boardRect: Rect
+    digitWidth: int
+    digitHeight: int
+    flagCountRect: Rect
+    timerRect: Rect
+    smileRect: Rect
+    closeIconRect: Rect
+    closeTouchRect: Rect
+
+
+def rectContains(rect: Rect, x: int, y: int) -> bool:
+    rectX, rectY, width, height = rect
+    return rectX <= x < rectX + width and rectY <= y < rectY + height
+
+
+@lru_cache(maxsize=8)
+def getLayout(screenWidth: int, screenHeight: int, maxX: int, maxY: int) -> Layout:
+    cellSize = (math.floor(screenWidth / maxX) -
+                (math.floor(BOARD_X_PADDING*2 / maxX)))
+    boardWidth = cellSize * maxX
+    boardHeight = cellSize * maxY
+    yDiff = screenHeight - boardHeight
+    boardRect = (BOARD_X_PADDING, math.floor(yDiff / 2) + BOARD_Y_PADDING,
+                 boardWidth, boardHeight)
+
+    digitHeight = math.floor(screenWidth / 10)
+    digitWidth = math.floor(digitHeight / 2)
+    flagCountRect = (HUD_X_PADDING, HUD_Y_PADDING, digitWidth*3, digitHeight)
+    timerRect = (screenWidth - HUD_X_PADDING - (digitWidth*3), HUD_Y_PADDING,
+                 digitWidth*3, digitHeight)
+
+    smileSize = math.floor(screenWidth / 10)
+    smileRect = (math.floor(screenWidth / 2 - (smileSize/2)), HUD_Y_PADDING,
+                 smileSize, smileSize)
+
+    return Layout(
+        screenWidth=screenWidth,
+        screenHeight=screenHeight,
+        maxX=maxX,
+        maxY=maxY,
+        cellSize=cellSize,
+        boardRect=boardRect,
+        digitWidth=digitWidth,
+        digitHeight=digitHeight,
+        flagCountRect=flagCountRect,
+        timerRect=timerRect,
+        smileRect=smileRect,
+        closeIconRect=(0, 0, CLOSE_ICON_SIZE, CLOSE_ICON_SIZE),
+        closeTouchRect=(0, 0, CLOSE_TOUCH_SIZE, CLOSE_TOUCH_SIZE),
+    )
@@ -1,280 +1,179 @@
-import argparse
-from common import Cell, Game
-from random import randrange
-import math
-from draw import drawCellsBatch, drawCloseIcon, drawTimer, drawFlagCount, closeDraw, initDraw, drawCell, drawSmile, getScreenSize, refreshScreen, disableRefresh, enableRefresh
 import time
+# Taken before the other imports so the startup report includes them
+IMPORT_START_TIME = time.monotonic()
+import argparse
+import random
+from backend import BACKENDS, WAVEFORM_NAMES, MemoryBackend, createBackend
+from common import Game
+from dataclasses import dataclass
+from typing import Final, Optional
+from draw import closeDraw, initDraw, clearScreen, preloadAtlas, getScreenSize, getSpriteCacheStats, setRefreshPolicy, getGameLayout
+from engine import createGame, flagCell, getElapsedSeconds, openCell, showHint
+from renderer import requestBoard, requestTimer, requestUpdate, startRenderer, stopRenderer, waitForRenderer
 import threading
-from stack import Stack
-from shell import killNickel, restartNickel
-from koboInput import initKoboInput, closeKoboInput, addKoboInputListener, removeKoboInputListener, ListenerName
-
-running = True
-
-
-def nonRepeatingNumbers(maxNumber: int):
-    array: list[int] = [i for i in range(maxNumber)]
+from shell import startKillNickel, restartNickel
+from layout import Layout, rectContains
+from profiler import Stage, StartupReport, enableProfiling, getProfileReport, getStartupReport, markStartupPhase, spanStart, spanEnd
+from solver import Solver, createSolver, getHint, markChanged
+from topology import TopologyName
+from koboInput import RecordedBoard, initKoboInput, readRecordedBoard, closeKoboInput, addKoboInputListener, removeKoboInputListener, startReplay, ListenerName
 
-    def getNumber():
-        nonlocal maxNumber
-        if maxNumber < 0:
-            return
-        random = randrange(0, maxNumber)
-        number = array[random]
-        array[random] = array[maxNumber-1]
-        array[maxNumber-1] = number
-        maxNumber -= 1
-        return number
+shutdownEvent = threading.Event()
 
-    return getNumber
+# How often the timer checks for a game that has not started yet
+TIMER_IDLE_S: Final[float] = 0.25
+# Wake this far past the second boundary so the floor lands on the new second
+TIMER_SLACK_MS: Final[int] = 5
 
+# Seeds are stored as signed 64-bit integers in recordings
+RECORD_SEED_MIN: Final[int] = -(1 << 63)
+RECORD_SEED_MAX: Final[int] = (1 << 63) - 1
 
-def getCellNeighbours(game: Game, x: int, y: int) -> list[Cell]:
-    neighbours: list[Cell] = []
-    for i in range(-1, 2):
-        for j in range(-1, 2):
-            newX = i+x
-            newY = j+y
-            if (x != newX or y != newY) and newX > -1 and newY > -1 and newX < game.maxX and newY < game.maxY:
-                neighbours.append(game.cells[newX][newY])
+# The game whose clock the timer thread draws
+_timerGame: Optional[Game] = None
 
-    return neighbours
 
+def getNextTickDelay(game: Optional[Game]) -> float:
+    if game is None or game.startTime == 0 or game.gameOver:
+        return TIMER_IDLE_S
+    elapsedMs = time.time() * 1000 - game.startTime
+    return (1000 - elapsedMs % 1000 + TIMER_SLACK_MS) / 1000
 
-def generateGrid(maxX: int, maxY: int) -> list[list[Cell]]:
-    cellList = []
-    for x in range(maxX):
-        cellList.append([])
-        for y in range(maxY):
-            cellList[x].append(Cell(x, y))
 
-    return cellList
-
-
-def placeMines(game: Game, mineCount: int) -> list[Cell]:
-    randomNumberGenerator = nonRepeatingNumbers(game.maxX * game.maxY)
-    cellsWithMines: list[Cell] = []
-    for _ in range(mineCount):
-        randomNumber = randomNumberGenerator()
-        if randomNumber is None:
+def timerTask():
+    while not shutdownEvent.wait(getNextTickDelay(_timerGame)):
+        game = _timerGame
+        if game is None or game.startTime == 0:
             continue
-
-        x = math.floor(randomNumber % game.maxX)
-        y = math.floor(randomNumber / game.maxX)
-
-        game.cells[x][y].isMine = True
-
-        cellsWithMines.append(game.cells[x][y])
-
-    return cellsWithMines
-
-
-def placeNumbers(game: Game, cellsWithMines: list[Cell]):
-    for cell in cellsWithMines:
-        neighbours = getCellNeighbours(game, cell.x, cell.y)
-        for neighbourCell in neighbours:
-            neighbourCell.number += 1
-
-
-def moveMine(game: Game, cell: Cell):
-    moved = False
-    for y in range(game.maxY):
-        for x in range(game.maxX):
-            if game.cells[x][y].isMine:
-                continue
-            game.cells[x][y].isMine = True
-            neighbours = getCellNeighbours(game, x, y)
-            for neighbour in neighbours:
-                neighbour.number += 1
-            moved = True
-            break
-        if moved:
-            break
-
-    cell.isMine = False
-    neighbours = getCellNeighbours(game, cell.x, cell.y)
-    for neighbour in neighbours:
-        neighbour.number -= 1
-
-
-def openMultiple(game: Game, cell: Cell):
-    myStack = Stack()
-    cell.isOpen = True
-    myStack.push(cell)
-    cellsToDraw: list[Cell] = []
-    while myStack.size() > 0:
-        poppedCell = myStack.pop()
-        neighbours = getCellNeighbours(game, poppedCell.x, poppedCell.y)
-
-        for neighbour in neighbours:
-            if not neighbour.isFlagged and not neighbour.isOpen:
-                neighbour.isOpen = True
-                game.nonMineCellsOpened += 1
-                if neighbour.number == 0:
-                    myStack.push(neighbour)
-                cellsToDraw.append(neighbour)
-    drawCellsBatch(game, cellsToDraw)
-
-
-def endGame(game: Game, won: bool):
-    game.gameOver = True
-    if not won:
-        game.hitMine = True
-        for row in game.cells:
-            for cell in row:
-                cell.isOpen = True
-
-    else:
-        for row in game.cells:
-            for cell in row:
-                if cell.isOpen:
-                    continue
-                cell.isFlagged = True
-
-    timeDiff = (time.time() * 1000) - game.startTime
-    drawBoard(game)
-    drawTimer(math.floor(timeDiff / 1000))
-    drawFlagCount(0)
-
-
-def checkWin(game: Game):
-    if game.nonMineCellsOpened < (game.maxX * game.maxY) - game.minesCount:
-        return
-    endGame(game, True)
-
-
-def flagCell(game: Game, cell: Cell):
-    if cell.isFlagged:
-        cell.isFlagged = False
-        game.flagsPlaced -= 1
-    else:
-        if not cell.isOpen:
-            cell.isFlagged = True
-            game.flagsPlaced += 1
-
-    drawCell(game, cell)
-    drawFlagCount(game.minesCount - game.flagsPlaced)
-
-
-def openCell(game: Game, cell: Cell):
-    if game.clicks == 0:
-        if cell.isMine:
-            moveMine(game, cell)
-            openCell(game, cell)
-            return
-        game.startTime = int(time.time() * 1000)
-
-    if not cell.isFlagged and not cell.isOpen:
-        if cell.isMine:
-            cell.isOpen = True
-            endGame(game, False)
-        else:
-            if cell.number == 0:
-                openMultiple(game, cell)
-            else:
-                cell.isOpen = True
-            game.nonMineCellsOpened += 1
-
-    game.clicks += 1
-    drawCell(game, cell)
-    checkWin(game)
-
-
-def createGame(x: int, y: int, mines: int):
-    currentGame = Game(generateGrid(x, y), x, y, mines)
-    cellsWithMines = placeMines(
-        currentGame, currentGame.minesCount)
-    placeNumbers(currentGame, cellsWithMines)
-    return currentGame
-
-
-def drawBoard(game: Game):
-    enableRefresh()
-    drawSmile(game)
-    drawTimer(0)
-    drawFlagCount(game.minesCount)
-    drawCloseIcon()
-    disableRefresh()
-    refreshScreen()
-    cellsToDraw: list[Cell] = []
-    for cell1 in game.cells:
-        for cell2 in cell1:
-            cellsToDraw.append(cell2)
-
-    drawCellsBatch(game, cellsToDraw)
-
-
-def getCellTouched(game: Game, touchX: int, touchY: int):
-    for rows in game.cells:
-        for cell in rows:
-            x = cell.screenX
-            y = cell.screenY
-            x2 = x + cell.size
-            y2 = y + cell.size
-            if x <= touchX <= x2 and y <= touchY <= y2:
-                return cell
-
-
-def isSmileTouched(game: Game, touchX: int, touchY: int):
-    x1, x2, y1, y2 = game.smileRect
-    if x1 <= touchX <= x2 and y1 <= touchY <= y2:
-        return True
-    return False
-
-
-def isCloseTouched(touchX: int, touchY: int):
-    if 0 <= touchX <= 120 and 0 <= touchY < 120:
-        return True
-    return False
-
-
-def handleTap(game: Game, touchX: int, touchY: int):
-    global running
-    closeTouched = isCloseTouched(touchX, touchY)
-
-    if closeTouched:
-        running = False
+        # Unchanged digits are skipped, usually only the last one blits
+        requestTimer(game, getElapsedSeconds(game))
+
+
+def setTimerGame(game: Game):
+    global _timerGame
+    _timerGame = game
+
+
+@dataclass
+class TouchTarget:
+    NONE: Final[str] = "NONE"
+    CELL: Final[str] = "CELL"
+    SMILE: Final[str] = "SMILE"
+    CLOSE: Final[str] = "CLOSE"
+
+
+def getCellTouched(game: Game, layout: Layout, touchX: int, touchY: int) -> Optional[int]:
+    xOrigin, yOrigin, _, _ = layout.boardRect
+    if touchX < xOrigin or touchY < yOrigin:
+        return None
+    x = (touchX - xOrigin) // layout.cellSize
+    y = (touchY - yOrigin) // layout.cellSize
+    if x >= game.maxX or y >= game.maxY:
+        return None
+    return y * game.maxX + x
+
+
+def getTouchTarget(game: Game, touchX: int, touchY: int) -> tuple[str, Optional[int]]:
+    layout = getGameLayout(game)
+    if rectContains(layout.closeTouchRect, touchX, touchY):
+        return (TouchTarget.CLOSE, None)
+    if rectContains(layout.smileRect, touchX, touchY):
+        return (TouchTarget.SMILE, None)
+    index = getCellTouched(game, layout, touchX, touchY)
+    if index is None:
+        return (TouchTarget.NONE, None)
+    return (TouchTarget.CELL, index)
+
+
+def newBoard(x: int, y: int, mines: int, seed: Optional[int], topology: str, safeZone: bool, noGuess: bool) -> Game:
+    if noGuess:
+        # The pool pulls in multiprocessing and the solver, only pay for
+        # them when no-guess boards are asked for
+        from boardPool import createNoGuessGame
+        game = createNoGuessGame(x, y, mines, seed)
+        if game is not None:
+            return game
+        print("No no-guess board ready, using a random one")
+    game = createGame(x, y, mines, seed, topology, safeZone)
+    # Keep asking the pool, it is being refilled meanwhile
+    game.noGuess = noGuess
+    return game
+
+
+def handleTap(game: Game, solver: Solver, touchX: int, touchY: int):
+    start = spanStart()
+    _handleTap(game, solver, touchX, touchY)
+    spanEnd(Stage.TAP, start)
+
+
+def _handleTap(game: Game, solver: Solver, touchX: int, touchY: int):
+    start = spanStart()
+    target, touchedCell = getTouchTarget(game, touchX, touchY)
+    spanEnd(Stage.DISPATCH, start)
+
+    if target == TouchTarget.CLOSE:
+        shutdownEvent.set()
         return
 
-    smileTouched = isSmileTouched(game, touchX, touchY)
-
-    if smileTouched:
+    if target == TouchTarget.SMILE:
         removeListeners(game)
-        newGame = createGame(game.maxX, game.maxY, game.minesCount)
-        t = threading.Thread(target=drawBoard, args=(newGame,))
-        t.start()
+        newGame = newBoard(game.maxX, game.maxY, game.minesCount,
+                           game.random.getrandbits(32), game.neighbours.name,
+                           game.safeZone, game.noGuess)
+        setTimerGame(newGame)
+        requestBoard(newGame)
         addListeners(newGame)
         return
 
-    if game.gameOver:
+    if game.gameOver or touchedCell is None:
         return
 
-    touchedCell = getCellTouched(game, touchX, touchY)
+    start = spanStart()
+    update = openCell(game, touchedCell)
+    spanEnd(Stage.GAME_LOGIC, start)
+    markChanged(solver, update.rects)
+    requestUpdate(game, update)
+
 
-    if touchedCell is None:
+def handleHoldEnd(game: Game, solver: Solver, touchX: int, touchY: int):
+    if game.gameOver:
         return
+    target, touchedCell = getTouchTarget(game, touchX, touchY)
 
-    openCell(game, touchedCell)
+    if target != TouchTarget.CELL or touchedCell is None:
+        return
 
+    start = spanStart()
+    update = flagCell(game, touchedCell)
+    spanEnd(Stage.GAME_LOGIC, start)
+    markChanged(solver, update.rects)
+    requestUpdate(game, update)
 
-def handleHoldEnd(game: Game, touchX: int, touchY: int):
+
+def handleSwipe(game: Game, solver: Solver):
     if game.gameOver:
         return
-    touchedCell = getCellTouched(game, touchX, touchY)
-
-    if touchedCell is None:
+    start = spanStart()
+    hint = getHint(solver)
+    spanEnd(Stage.HINT, start)
+    if hint is None:
         return
-
-    flagCell(game, touchedCell)
+    index, _ = hint
+    # Only the hint mark changes, the solver has nothing new to learn
+    requestUpdate(game, showHint(game, index))
 
 
 def addListeners(game: Game):
+    solver = createSolver(game)
     tapListener = addKoboInputListener(ListenerName.onTap, lambda x,
-                                       y: handleTap(game, x, y))
+                                       y: handleTap(game, solver, x, y))
     holdEndListener = addKoboInputListener(ListenerName.onHoldEnd, lambda x,
-                                           y, _: handleHoldEnd(game, x, y))
+                                           y, _: handleHoldEnd(game, solver, x, y))
+    swipeListener = addKoboInputListener(ListenerName.onSwipe, lambda *_:
+                                         handleSwipe(game, solver))
     game.tapListener = tapListener
     game.holdEndListener = holdEndListener
+    game.swipeListener = swipeListener
 
 
 def removeListeners(game: Game):
@@ -282,6 +181,8 @@ def removeListeners(game: Game):
         removeKoboInputListener(ListenerName.onTap, game.tapListener)
     if game.holdEndListener is not None:
         removeKoboInputListener(ListenerName.onHoldEnd, game.holdEndListener)
+    if game.swipeListener is not None:
+        removeKoboInputListener(ListenerName.onSwipe, game.swipeListener)
 
 
 def main():
@@ -290,6 +191,30 @@ def main():
     parser.add_argument('-y', dest='y', type=int, help='Number of columns')
     parser.add_argument('-mines', dest='mines',
                         type=int, help='Number of mines')
+    parser.add_argument('-wrap', dest='wrap', action='store_true',
+                        help='Let the board wrap around its edges')
+    parser.add_argument('-safe-zone', dest='safeZone', action='store_true',
+                        help='Keep the 3x3 area around the first tap free of mines')
+    parser.add_argument('-no-guess', dest='noGuess', action='store_true',
+                        help='Play boards from the pool built by boardPool.py, solvable without guessing')
+    parser.add_argument('-seed', dest='seed', type=int,
+                        help='Seed for reproducible boards')
+    parser.add_argument('-fast-waveform', dest='fastWaveform', default='DU', choices=WAVEFORM_NAMES,
+                        help='Waveform for cell and counter updates')
+    parser.add_argument('-quality-waveform', dest='qualityWaveform', default='GC16', choices=WAVEFORM_NAMES,
+                        help='Waveform for the smiley and board redraws')
+    parser.add_argument('-full-refresh-every', dest='fullRefreshEvery', type=int, default=30,
+                        help='Partial refreshes before a flashing full refresh, 0 to disable')
+    parser.add_argument('-backend', dest='backend', default='fbink', choices=list(BACKENDS),
+                        help='Where to draw, memory and null run without a screen')
+    parser.add_argument('-record', dest='recordPath',
+                        help='Record touch input to this file')
+    parser.add_argument('-replay', dest='replayPath',
+                        help='Play back touch input recorded with -record')
+    parser.add_argument('-replay-fast', dest='replayFast', action='store_true',
+                        help='Replay as fast as possible instead of in real time')
+    parser.add_argument('-profile', '--profile', dest='profile', action='store_true',
+                        help='Print per-stage timings on exit')
     args = parser.parse_args()
     x = args.x or 9
     y = args.y or 9
@@ -298,21 +223,105 @@ def main():
     if mines >= x * y:
         mines = (x*y) - 1
 
-    killNickel()
-    initDraw()
+    seed = args.seed
+    topology = TopologyName.TORUS if args.wrap else TopologyName.GRID
+    safeZone = args.safeZone
+    noGuess = args.noGuess
+    if noGuess and args.wrap:
+        print("-no-guess boards do not wrap, ignoring -no-guess")
+        noGuess = False
+    if args.replayPath is not None:
+        # The recording holds the board it was played on, taps only mean
+        # the same thing on that board
+        recordedBoard = readRecordedBoard(args.replayPath)
+        if recordedBoard is None:
+            parser.error(f"cannot replay {args.replayPath}")
+        x, y, mines = recordedBoard.x, recordedBoard.y, recordedBoard.mines
+        seed = recordedBoard.seed
+        topology = recordedBoard.topology
+        safeZone = recordedBoard.safeZone
+        noGuess = False
+        print(f"Replaying {x}x{y} with {mines} mines, seed {seed}")
+    elif args.recordPath is not None:
+        if seed is None:
+            seed = random.getrandbits(32)
+        elif not RECORD_SEED_MIN <= seed <= RECORD_SEED_MAX:
+            parser.error("-record needs a seed that fits in 64 bits")
+        if noGuess:
+            print("-no-guess boards come from the pool, "
+                  "replays of this session will play a random board")
+        print(f"Recording with seed {seed}")
+
+    setRefreshPolicy(args.fastWaveform, args.qualityWaveform,
+                     max(0, args.fullRefreshEvery))
+
+    if args.profile:
+        enableProfiling()
+
+    startTime = time.monotonic()
+    startCpuTime = time.process_time()
+    startup = StartupReport(IMPORT_START_TIME)
+    markStartupPhase(startup, "imports")
+
+    # Off-device backends leave Nickel alone
+    onDevice = args.backend == 'fbink'
+    nickel = startKillNickel() if onDevice else None
+    backend = createBackend(args.backend)
+    initDraw(backend)
+    markStartupPhase(startup, "backend init")
+
+    # Sprites decode and the board generates while Nickel shuts down
+    preload = threading.Thread(target=preloadAtlas, args=(x, y))
+    preload.start()
+    currentGame = newBoard(x, y, mines, seed, topology, safeZone, noGuess)
+    markStartupPhase(startup, "board generation")
+    preload.join()
+    markStartupPhase(startup, "sprite preload")
+    if nickel is not None:
+        nickel.wait()
+    markStartupPhase(startup, "nickel shutdown")
+
+    clearScreen()
+    markStartupPhase(startup, "clear screen")
     screenWidth, _ = getScreenSize()
-    initKoboInput(screenWidth, grabInput=False)
-
-    currentGame = createGame(x, y, mines)
-    drawBoard(currentGame)
+    initKoboInput(screenWidth, grabInput=False, recordPath=args.recordPath,
+                  recordedBoard=RecordedBoard(seed or 0, x, y, mines,
+                                              topology, safeZone),
+                  replayPath=args.replayPath, replayRealtime=not args.replayFast,
+                  onReplayEnd=shutdownEvent.set)
+    markStartupPhase(startup, "input init")
+    startRenderer()
+    requestBoard(currentGame)
     addListeners(currentGame)
+    waitForRenderer()
+    markStartupPhase(startup, "first board")
+    print("\n".join(getStartupReport(startup)))
+    setTimerGame(currentGame)
+    timer = threading.Thread(target=timerTask)
+    timer.start()
+    startReplay()
 
-    while running:
-        continue
+    shutdownEvent.wait()
+    timer.join()
 
     closeKoboInput()
+    waitForRenderer()
+    stopRenderer()
+    if isinstance(backend, MemoryBackend):
+        stats = backend.stats
+        print(f"Render: {stats.blits} blits, {stats.bytesCopied} bytes, "
+              f"{stats.refreshes} refreshes ({stats.flashingRefreshes} flashing), "
+              f"{stats.refreshedArea} px refreshed")
     closeDraw()
-    restartNickel()
+    sessionTime = time.monotonic() - startTime
+    cpuTime = time.process_time() - startCpuTime
+    if onDevice:
+        restartNickel()
+    hits, misses, evictions = getSpriteCacheStats()
+    print(f"Sprite cache: {hits} hits, {misses} misses, {evictions} evictions")
+    print(f"Session: {sessionTime:.1f}s, CPU time: {cpuTime:.2f}s")
+    if args.profile:
+        print("\n".join(getProfileReport()))
     print("Goodbye")
 
 
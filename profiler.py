@@ -0,0 +1,95 @@
+from array import array
+from dataclasses import dataclass, field
+from typing import Final
+import time
+
+# Samples kept per stage, older ones are overwritten
+PROFILE_SAMPLES: Final[int] = 1024
+
+
+@dataclass
+class Stage:
+    INPUT_DECODE: Final[str] = "input decode"
+    DISPATCH: Final[str] = "dispatch"
+    TAP: Final[str] = "tap total"
+    GAME_LOGIC: Final[str] = "game logic"
+    SPRITE_DECODE: Final[str] = "sprite decode"
+    BLIT: Final[str] = "blit"
+    REFRESH: Final[str] = "refresh"
+    RENDER: Final[str] = "render batch"
+    HINT: Final[str] = "hint"
+
+
+@dataclass
+class StageSamples:
+    durations: array = field(
+        default_factory=lambda: array('q', bytes(8 * PROFILE_SAMPLES)))
+    count: int = 0
+    # Over the whole session, not just the samples still in the ring
+    maximum: int = 0
+
+
+_enabled = False
+_stages: dict[str, StageSamples] = {}
+
+
+def enableProfiling():
+    global _enabled
+    _enabled = True
+
+
+def spanStart() -> int:
+    # 0 marks a disabled span, spanEnd then returns straight away
+    if not _enabled:
+        return 0
+    return time.perf_counter_ns()
+
+
+def spanEnd(stage: str, start: int):
+    if not start:
+        return
+    duration = time.perf_counter_ns() - start
+    samples = _stages.get(stage)
+    if samples is None:
+        samples = _stages.setdefault(stage, StageSamples())
+    # Unlocked, a sample lost to two threads racing here does not matter
+    samples.durations[samples.count % PROFILE_SAMPLES] = duration
+    samples.count += 1
+    if duration > samples.maximum:
+        samples.maximum = duration
+
+
+@dataclass
+class StartupReport:
+    lastTime: float
+    phases: list[tuple[str, float]] = field(default_factory=list)
+
+
+def markStartupPhase(report: StartupReport, name: str):
+    now = time.monotonic()
+    report.phases.append((name, now - report.lastTime))
+    report.lastTime = now
+
+
+def getStartupReport(report: StartupReport) -> list[str]:
+    lines = [f"{name:<20}{seconds * 1000:>8.1f} ms"
+             for name, seconds in report.phases]
+    total = sum(seconds for _, seconds in report.phases)
+    lines.append(f"{'startup total':<20}{total * 1000:>8.1f} ms")
+    return lines
+
+
+def _percentile(durations: list[int], ratio: float) -> int:
+    return durations[min(len(durations) - 1, int(len(durations) * ratio))]
+
+
+def getProfileReport() -> list[str]:
+    lines = [f"{'stage':<16}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}"]
+    for stage, samples in _stages.items():
+        durations = sorted(samples.durations[:min(samples.count, PROFILE_SAMPLES)])
+        p50 = _percentile(durations, 0.5) / 1e6
+        p95 = _percentile(durations, 0.95) / 1e6
+        maximum = samples.maximum / 1e6
+        lines.append(f"{stage:<16}{samples.count:>8}"
+                     f"{p50:>10.3f}{p95:>10.3f}{maximum:>10.3f}")
+    return lines
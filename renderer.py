@@ -0,0 +1,152 @@
+from common import Game
+from dataclasses import dataclass, field
+from typing import Final, Optional
+from draw import drawBoardCells, drawCellRects, drawCloseIcon, drawFlagCount, drawSmile, drawTimer, disableRefresh, enableRefresh, refreshScreen, useAtlas
+from engine import BoardUpdate, getElapsedSeconds
+from layout import Rect
+from profiler import Stage, spanStart, spanEnd
+import threading
+
+# How long stopRenderer waits for a batch in progress
+STOP_TIMEOUT_S: Final[float] = 2.0
+
+
+@dataclass
+class Counter:
+    TIMER: Final[str] = "timer"
+    FLAGS: Final[str] = "flags"
+
+
+@dataclass
+class RenderQueue:
+    condition: threading.Condition = field(default_factory=threading.Condition)
+    # Commands for any other game are stale and dropped
+    game: Optional[Game] = None
+    board: bool = False
+    # Cells are drawn from the board as it is when the batch runs, so a
+    # rect queued many times is drawn once with its latest state
+    rects: dict[Rect, None] = field(default_factory=dict)
+    smile: bool = False
+    # Counter name -> value, the last one queued wins
+    counters: dict[str, int] = field(default_factory=dict)
+    running: bool = False
+    drawing: bool = False
+    thread: Optional[threading.Thread] = None
+
+
+_queue = RenderQueue()
+
+
+def _hasWork(queue: RenderQueue) -> bool:
+    return queue.board or bool(queue.rects) or queue.smile or bool(queue.counters)
+
+
+def _drawBatch(game: Game, board: bool, rects: list[Rect], smile: bool, counters: dict[str, int]):
+    if board:
+        useAtlas(game)
+    disableRefresh()
+    if board:
+        drawSmile(game)
+        drawTimer(game, 0)
+        drawFlagCount(game, game.minesCount)
+        drawCloseIcon(game)
+        drawBoardCells(game)
+    if rects:
+        drawCellRects(game, rects)
+    if smile:
+        drawSmile(game)
+    if Counter.TIMER in counters:
+        drawTimer(game, counters[Counter.TIMER])
+    if Counter.FLAGS in counters:
+        drawFlagCount(game, counters[Counter.FLAGS])
+    enableRefresh()
+    refreshScreen()
+
+
+def _task():
+    queue = _queue
+    while True:
+        with queue.condition:
+            while queue.running and not _hasWork(queue):
+                queue.condition.wait()
+            if not queue.running:
+                return
+            game = queue.game
+            board = queue.board
+            rects = list(queue.rects)
+            smile = queue.smile
+            counters = queue.counters
+            queue.board = False
+            queue.rects = {}
+            queue.smile = False
+            queue.counters = {}
+            queue.drawing = True
+
+        start = spanStart()
+        try:
+            if game is not None:
+                _drawBatch(game, board, rects, smile, counters)
+        except Exception as e:
+            print("Render failed: ", e)
+        spanEnd(Stage.RENDER, start)
+
+        with queue.condition:
+            queue.drawing = False
+            queue.condition.notify_all()
+
+
+def requestBoard(game: Game):
+    # Whatever is still queued belongs to the old board
+    with _queue.condition:
+        _queue.game = game
+        _queue.board = True
+        _queue.rects = {}
+        _queue.smile = False
+        _queue.counters = {}
+        _queue.condition.notify_all()
+
+
+def requestUpdate(game: Game, update: BoardUpdate):
+    with _queue.condition:
+        if game is not _queue.game:
+            return
+        for rect in update.rects:
+            _queue.rects[rect] = None
+        if update.gameEnded:
+            _queue.smile = True
+            _queue.counters[Counter.TIMER] = getElapsedSeconds(game)
+            _queue.counters[Counter.FLAGS] = 0
+        elif update.flagsChanged:
+            _queue.counters[Counter.FLAGS] = game.minesCount - game.flagsPlaced
+        _queue.condition.notify_all()
+
+
+def requestTimer(game: Game, seconds: int):
+    with _queue.condition:
+        # Once the game is over only requestUpdate sets the final time
+        if game is not _queue.game or game.gameOver:
+            return
+        _queue.counters[Counter.TIMER] = seconds
+        _queue.condition.notify_all()
+
+
+def waitForRenderer():
+    with _queue.condition:
+        while _queue.running and (_hasWork(_queue) or _queue.drawing):
+            _queue.condition.wait()
+
+
+def startRenderer():
+    _queue.running = True
+    thread = threading.Thread(target=_task)
+    _queue.thread = thread
+    thread.start()
+
+
+def stopRenderer():
+    with _queue.condition:
+        _queue.running = False
+        _queue.condition.notify_all()
+    thread = _queue.thread
+    if thread is not None and thread is not threading.current_thread():
+        thread.join(STOP_TIMEOUT_S)
@@ -6,5 +6,9 @@ path = os.path.dirname(__file__)
 def killNickel():
     subprocess.call(["sh", f"{path}/killNickel.sh"])
 
+def startKillNickel() -> subprocess.Popen:
+    # Lets startup carry on while Nickel shuts down, wait() before drawing
+    return subprocess.Popen(["sh", f"{path}/killNickel.sh"])
+
 def restartNickel():
     subprocess.call(["sh", f"{path}/restart.sh"])
@@ -0,0 +1,376 @@
+from common import Game, CELL_NUMBER, CELL_OPEN, CELL_FLAG
+from dataclasses import dataclass, field
+from layout import Rect
+from typing import Final, Optional
+import math
+
+# Backtracking steps per component before falling back to local estimates
+ENUMERATION_STEP_LIMIT: Final[int] = 50000
+# Larger components are estimated, the backtracking recurses once per cell
+ENUMERATION_MAX_CELLS: Final[int] = 500
+
+# (unknown cells, mines among them)
+Constraint = tuple[frozenset[int], int]
+# mines in the component -> (solutions, summed mines per cell group)
+ComponentCounts = dict[int, tuple[int, list[int]]]
+# (cell groups, counts)
+Enumeration = tuple[list[list[int]], ComponentCounts]
+
+
+@dataclass
+class Solver:
+    # Only open numbers and flags are read, never where the mines are
+    game: Game
+    # Hidden cells proven safe or mined by deduction
+    safe: set[int] = field(default_factory=set)
+    mines: set[int] = field(default_factory=set)
+    # Open cell -> what its number still says about its hidden neighbours
+    constraints: dict[int, Constraint] = field(default_factory=dict)
+    # Hidden cell -> open cells whose constraint includes it
+    cellConstraints: dict[int, set[int]] = field(default_factory=dict)
+    # Cells changed since the last hint, their constraints are rebuilt then
+    dirty: set[int] = field(default_factory=set)
+    # Flags the deductions were made with
+    flags: set[int] = field(default_factory=set)
+    # Component constraints -> enumeration, kept while the component is
+    # unchanged so a hint only enumerates what the last move touched
+    enumerations: dict[frozenset[Constraint], Enumeration] = field(default_factory=dict)
+
+
+def createSolver(game: Game) -> Solver:
+    solver = Solver(game)
+    # Boards can start with cells already open
+    solver.dirty.update(index for index, state in enumerate(game.board)
+                        if state & CELL_OPEN)
+    return solver
+
+
+def markChanged(solver: Solver, rects: list[Rect]):
+    maxX = solver.game.maxX
+    for x, y, width, height in rects:
+        for row in range(y, y + height):
+            start = row * maxX + x
+            solver.dirty.update(range(start, start + width))
+
+
+def _isHidden(state: int) -> bool:
+    return not state & (CELL_OPEN | CELL_FLAG)
+
+
+def _getNeighbours(game: Game, index: int) -> list[int]:
+    table = game.neighbours
+    return [index + delta for delta in table.deltas[table.cellClass[index]]]
+
+
+def _setConstraint(solver: Solver, index: int, constraint: Optional[Constraint]):
+    old = solver.constraints.pop(index, None)
+    if old is not None:
+        for cell in old[0]:
+            owners = solver.cellConstraints.get(cell)
+            if owners is not None:
+                owners.discard(index)
+                if not owners:
+                    del solver.cellConstraints[cell]
+    if constraint is None:
+        return
+    solver.constraints[index] = constraint
+    for cell in constraint[0]:
+        solver.cellConstraints.setdefault(cell, set()).add(index)
+
+
+def _buildConstraint(solver: Solver, index: int) -> Optional[Constraint]:
+    game = solver.game
+    board = game.board
+    state = board[index]
+    if not state & CELL_OPEN:
+        return None
+    remaining = state & CELL_NUMBER
+    unknown: list[int] = []
+    for neighbour in _getNeighbours(game, index):
+        neighbourState = board[neighbour]
+        if neighbourState & CELL_FLAG or neighbour in solver.mines:
+            remaining -= 1
+        elif not neighbourState & CELL_OPEN and neighbour not in solver.safe:
+            unknown.append(neighbour)
+    if not unknown:
+        return None
+    return (frozenset(unknown), remaining)
+
+
+def _deduce(solver: Solver, cells: frozenset[int], isMine: bool, work: set[int]):
+    known = solver.mines if isMine else solver.safe
+    for cell in cells:
+        if cell in known:
+            continue
+        known.add(cell)
+        # Every constraint that counted this cell as unknown must shrink
+        work.update(solver.cellConstraints.get(cell, ()))
+
+
+def _applyConstraint(solver: Solver, cells: frozenset[int], mines: int, work: set[int]) -> bool:
+    if mines == 0:
+        _deduce(solver, cells, False, work)
+        return True
+    if mines == len(cells):
+        _deduce(solver, cells, True, work)
+        return True
+    return False
+
+
+def _propagate(solver: Solver):
+    game = solver.game
+    board = game.board
+    work: set[int] = set()
+    if not solver.flags <= game.flags:
+        # Deductions may rest on a flag that is gone, start over. The old
+        # constraints were reduced with those deductions, and open cells
+        # whose neighbours were all deduced have none left, so every open
+        # cell is rebuilt from scratch, as createSolver does
+        solver.safe.clear()
+        solver.mines.clear()
+        solver.constraints.clear()
+        solver.cellConstraints.clear()
+        solver.dirty.update(index for index, state in enumerate(board)
+                            if state & CELL_OPEN)
+    solver.flags = set(game.flags)
+    for index in solver.dirty:
+        state = board[index]
+        if state & CELL_OPEN:
+            solver.safe.discard(index)
+        if not _isHidden(state):
+            # A flag or an opened cell replaces whatever was deduced
+            solver.mines.discard(index)
+            work.update(solver.cellConstraints.get(index, ()))
+        work.add(index)
+        for neighbour in _getNeighbours(game, index):
+            if board[neighbour] & CELL_OPEN:
+                work.add(neighbour)
+    solver.dirty.clear()
+
+    while work:
+        index = work.pop()
+        constraint = _buildConstraint(solver, index)
+        _setConstraint(solver, index, constraint)
+        if constraint is None:
+            continue
+        cells, mines = constraint
+        if _applyConstraint(solver, cells, mines, work):
+            continue
+        # Subset rule: when one constraint's cells contain another's, the
+        # difference holds exactly the difference of their mine counts
+        others = set()
+        for cell in cells:
+            others.update(solver.cellConstraints[cell])
+        others.discard(index)
+        for other in others:
+            otherCells, otherMines = solver.constraints[other]
+            if otherCells < cells:
+                if _applyConstraint(solver, cells - otherCells, mines - otherMines, work):
+                    work.add(index)
+                    break
+            elif cells < otherCells:
+                if _applyConstraint(solver, otherCells - cells, otherMines - mines, work):
+                    work.add(other)
+
+
+def _getComponents(solver: Solver) -> list[list[int]]:
+    # Constraints sharing a cell end up in the same component
+    seen: set[int] = set()
+    components: list[list[int]] = []
+    for start in solver.constraints:
+        if start in seen:
+            continue
+        seen.add(start)
+        stack = [start]
+        members: list[int] = []
+        while stack:
+            index = stack.pop()
+            members.append(index)
+            for cell in solver.constraints[index][0]:
+                for other in solver.cellConstraints[cell]:
+                    if other not in seen:
+                        seen.add(other)
+                        stack.append(other)
+        components.append(members)
+    return components
+
+
+def _enumerateComponent(solver: Solver, members: list[int]) -> Optional[Enumeration]:
+    constraints = [solver.constraints[index] for index in members]
+    memberPosition = {index: i for i, index in enumerate(members)}
+
+    # Cells that belong to exactly the same constraints are interchangeable,
+    # so only how many mines each such group holds is enumerated
+    groupsByOwners: dict[frozenset[int], list[int]] = {}
+    seen: set[int] = set()
+    for constraintCells, _ in constraints:
+        for cell in sorted(constraintCells - seen):
+            seen.add(cell)
+            owners = frozenset(memberPosition[owner]
+                               for owner in solver.cellConstraints[cell])
+            groupsByOwners.setdefault(owners, []).append(cell)
+    if sum(map(len, groupsByOwners.values())) > ENUMERATION_MAX_CELLS:
+        return None
+    # Groups in the order their constraints were reached keep neighbouring
+    # groups close together, so constraints fill up early and prune well
+    groups = list(groupsByOwners.values())
+    groupChecks = [sorted(owners) for owners in groupsByOwners]
+
+    remaining = [mines for _, mines in constraints]
+    unassigned = [len(constraintCells) for constraintCells, _ in constraints]
+    groupMines = [0] * len(groups)
+    counts: ComponentCounts = {}
+    steps = 0
+
+    def place(depth: int, placed: int, ways: int) -> bool:
+        nonlocal steps
+        steps += 1
+        if steps > ENUMERATION_STEP_LIMIT:
+            return False
+        if depth == len(groups):
+            total, mineWays = counts.get(placed, (0, [0] * len(groups)))
+            for i, mines in enumerate(groupMines):
+                mineWays[i] += ways * mines
+            counts[placed] = (total + ways, mineWays)
+            return True
+
+        size = len(groups[depth])
+        checks = groupChecks[depth]
+        for constraintIndex in checks:
+            unassigned[constraintIndex] -= size
+        for mines in range(size + 1):
+            valid = True
+            for constraintIndex in checks:
+                left = remaining[constraintIndex] - mines
+                if left < 0 or left > unassigned[constraintIndex]:
+                    valid = False
+                    break
+            if valid:
+                for constraintIndex in checks:
+                    remaining[constraintIndex] -= mines
+                groupMines[depth] = mines
+                if not place(depth + 1, placed + mines,
+                             ways * math.comb(size, mines)):
+                    return False
+                for constraintIndex in checks:
+                    remaining[constraintIndex] += mines
+        for constraintIndex in checks:
+            unassigned[constraintIndex] += size
+        groupMines[depth] = 0
+        return True
+
+    if not place(0, 0, 1):
+        return None
+    return (groups, counts)
+
+
+def _convolve(left: dict[int, int], right: dict[int, int]) -> dict[int, int]:
+    result: dict[int, int] = {}
+    for leftMines, leftWays in left.items():
+        for rightMines, rightWays in right.items():
+            mines = leftMines + rightMines
+            result[mines] = result.get(mines, 0) + leftWays * rightWays
+    return result
+
+
+def _getProbabilities(solver: Solver) -> dict[int, float]:
+    game = solver.game
+    board = game.board
+    frontier = solver.cellConstraints.keys()
+    interior = [index for index, state in enumerate(board)
+                if _isHidden(state) and index not in solver.safe
+                and index not in solver.mines and index not in frontier]
+    minesLeft = game.minesCount - len(game.flags) - len(solver.mines)
+
+    probabilities: dict[int, float] = {}
+    components: list[Enumeration] = []
+    # Cells of components too large to enumerate
+    estimated: set[int] = set()
+    previous = solver.enumerations
+    solver.enumerations = {}
+    for members in _getComponents(solver):
+        key = frozenset(solver.constraints[index] for index in members)
+        enumerated = previous.get(key)
+        if enumerated is None:
+            enumerated = _enumerateComponent(solver, members)
+        if enumerated is None:
+            # Too large to enumerate, use the densest constraint per cell
+            for index in members:
+                cells, mines = solver.constraints[index]
+                estimated.update(cells)
+                for cell in cells:
+                    probabilities[cell] = max(probabilities.get(cell, 0.0),
+                                              mines / len(cells))
+            continue
+        solver.enumerations[key] = enumerated
+        components.append(enumerated)
+
+    # Mines not in an enumerated component are spread over the interior and
+    # the estimated cells alike, counting only the interior would crowd the
+    # estimated cells' mines into it
+    unconstrained = len(interior) + len(estimated)
+
+    def getWays(totals: dict[int, int], extra: int) -> int:
+        # Ways to finish a frontier arrangement by placing the rest outside
+        return sum(ways * math.comb(unconstrained, minesLeft - extra - mines)
+                   for mines, ways in totals.items()
+                   if 0 <= minesLeft - extra - mines <= unconstrained)
+
+    totals = [{mines: ways for mines, (ways, _) in counts.items()}
+              for _, counts in components]
+    everything: dict[int, int] = {0: 1}
+    for componentTotals in totals:
+        everything = _convolve(everything, componentTotals)
+    weight = getWays(everything, 0)
+    if weight == 0:
+        # The flags contradict the numbers, nothing exact can be said
+        return probabilities
+
+    for i, (groups, counts) in enumerate(components):
+        others: dict[int, int] = {0: 1}
+        for j, componentTotals in enumerate(totals):
+            if j != i:
+                others = _convolve(others, componentTotals)
+        groupWeights = [0] * len(groups)
+        for mines, (_, mineWays) in counts.items():
+            ways = getWays(others, mines)
+            for groupIndex, groupMineWays in enumerate(mineWays):
+                groupWeights[groupIndex] += groupMineWays * ways
+        for group, groupWeight in zip(groups, groupWeights):
+            # Mines are spread evenly over the cells of a group
+            probability = groupWeight / (weight * len(group))
+            for cell in group:
+                probabilities[cell] = probability
+
+    if interior:
+        interiorMines = sum(
+            ways * math.comb(unconstrained, minesLeft - mines) * (minesLeft - mines)
+            for mines, ways in everything.items()
+            if 0 <= minesLeft - mines <= unconstrained)
+        interiorProbability = interiorMines / weight / unconstrained
+        for cell in interior:
+            probabilities[cell] = interiorProbability
+    return probabilities
+
+
+def getHint(solver: Solver) -> Optional[tuple[int, float]]:
+    """Returns a hidden cell to open next and its chance of being a mine,
+    a proven safe cell when there is one."""
+    game = solver.game
+    if game.gameOver:
+        return None
+    if game.clicks == 0:
+        # The first click never hits a mine
+        return ((game.maxY // 2) * game.maxX + game.maxX // 2, 0.0)
+
+    _propagate(solver)
+    board = game.board
+    safe = [cell for cell in solver.safe if _isHidden(board[cell])]
+    if safe:
+        return (min(safe), 0.0)
+
+    probabilities = _getProbabilities(solver)
+    if not probabilities:
+        return None
+    cell = min(probabilities, key=lambda cell: (probabilities[cell], cell))
+    return (cell, probabilities[cell])
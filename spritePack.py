@@ -0,0 +1,79 @@
+from dataclasses import dataclass
+from typing import Final, Optional
+import mmap
+import struct
+
+# A pack is this header, one index entry per sprite, then the Y8 pixel data
+# of every sprite. Offsets in the index are from the start of the file
+PACK_MAGIC: Final[bytes] = b"KMSPACK1"
+PACK_HEADER: Final[struct.Struct] = struct.Struct('<8sHHI')
+# (name, width, height, offset, length)
+PACK_ENTRY: Final[struct.Struct] = struct.Struct('<32sHHII')
+
+PACK_NAME: Final[str] = "sprites.pack"
+
+# (name, width, height)
+SpriteKey = tuple[str, int, int]
+
+
+@dataclass
+class SpritePack:
+    screenWidth: int
+    screenHeight: int
+    # Read-only map of the whole file, blits point straight into it
+    buffer: mmap.mmap
+    # (name, width, height) -> (offset, length)
+    sprites: dict[SpriteKey, tuple[int, int]]
+
+
+def writeSpritePack(packPath: str, screenWidth: int, screenHeight: int,
+                    sprites: dict[SpriteKey, bytes]):
+    header = PACK_HEADER.pack(PACK_MAGIC, screenWidth,
+                              screenHeight, len(sprites))
+    offset = PACK_HEADER.size + PACK_ENTRY.size * len(sprites)
+    index: list[bytes] = []
+    for (name, width, height), rawData in sprites.items():
+        index.append(PACK_ENTRY.pack(name.encode("ascii"), width, height,
+                                     offset, len(rawData)))
+        offset += len(rawData)
+
+    with open(packPath, "wb") as file:
+        file.write(header)
+        file.write(b"".join(index))
+        for rawData in sprites.values():
+            file.write(rawData)
+
+
+def openSpritePack(packPath: str) -> Optional[SpritePack]:
+    try:
+        with open(packPath, "rb") as file:
+            buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+    if len(buffer) < PACK_HEADER.size:
+        buffer.close()
+        return None
+    magic, screenWidth, screenHeight, count = PACK_HEADER.unpack_from(buffer)
+    if magic != PACK_MAGIC:
+        print(f"{packPath} is not a sprite pack")
+        buffer.close()
+        return None
+
+    # A partial copy would have blits read past the end of the map
+    indexEnd = PACK_HEADER.size + PACK_ENTRY.size * count
+    if indexEnd > len(buffer):
+        print(f"{packPath} is truncated, its index needs {indexEnd} bytes")
+        buffer.close()
+        return None
+
+    sprites: dict[SpriteKey, tuple[int, int]] = {}
+    for name, width, height, offset, length in PACK_ENTRY.iter_unpack(
+            buffer[PACK_HEADER.size:indexEnd]):
+        key = (name.rstrip(b"\0").decode("ascii"), width, height)
+        if offset + length > len(buffer):
+            print(f"{packPath} is truncated, {key[0]} ends past the file")
+            buffer.close()
+            return None
+        sprites[key] = (offset, length)
+    return SpritePack(screenWidth, screenHeight, buffer, sprites)
@@ -0,0 +1,37 @@
+import random
+from common import CELL_MINE, CELL_NUMBER, CELL_OPEN, CELL_FLAG
+from engine import createGameWithMines, getSpanRects, openScanline, openWithTable, sampleMines
+
+
+def testScanlineFillMatchesTableFill():
+    for seed in range(3000):
+        rng = random.Random(seed)
+        x = rng.randint(1, 24)
+        y = rng.randint(1, 24)
+        mines = sampleMines(x * y, rng.randint(0, x * y // 4), rng)
+        scanline = createGameWithMines(x, y, mines, random.Random(seed))
+        table = createGameWithMines(x, y, list(mines), random.Random(seed))
+        for index in rng.sample(range(x * y), rng.randint(0, x * y // 8)):
+            if not scanline.board[index] & CELL_MINE or rng.random() < 0.5:
+                scanline.board[index] |= CELL_FLAG
+                table.board[index] |= CELL_FLAG
+
+        # Both fills start from a closed, unflagged zero cell
+        zeros = [index for index, state in enumerate(scanline.board)
+                 if state & (CELL_NUMBER | CELL_MINE | CELL_FLAG) == 0]
+        if not zeros:
+            continue
+        start = rng.choice(zeros)
+        before = bytes(scanline.board)
+        scanlineOpened, spans = openScanline(scanline, start)
+        tableOpened, _ = openWithTable(table, start)
+
+        assert scanline.board == table.board
+        assert scanlineOpened == tableOpened
+        opened = {index for index in range(x * y)
+                  if scanline.board[index] & CELL_OPEN and not before[index] & CELL_OPEN}
+        assert len(opened) == scanlineOpened
+        covered = {(rectY + row) * x + rectX + column
+                   for rectX, rectY, width, height in getSpanRects(spans)
+                   for row in range(height) for column in range(width)}
+        assert covered == opened
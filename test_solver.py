@@ -0,0 +1,105 @@
+import itertools
+import random
+from common import Game, CELL_NUMBER, CELL_OPEN, CELL_FLAG
+from engine import createGame, flagCell, openCell
+from solver import Solver, createSolver, getHint, markChanged
+import solver as solverModule
+from typing import Optional
+
+# Brute force enumerates every placement, so only tiny boards are checked
+BRUTE_FORCE_MAX_HIDDEN: int = 16
+
+
+def getBruteForceProbabilities(game: Game) -> Optional[dict[int, float]]:
+    board = game.board
+    hidden = [index for index, state in enumerate(board)
+              if not state & (CELL_OPEN | CELL_FLAG)]
+    if len(hidden) > BRUTE_FORCE_MAX_HIDDEN:
+        return None
+    table = game.neighbours
+    openCells = [index for index, state in enumerate(board) if state & CELL_OPEN]
+    total = 0
+    counts = dict.fromkeys(hidden, 0)
+    for placement in itertools.combinations(hidden, game.minesCount - len(game.flags)):
+        mines = set(placement) | game.flags
+        if all(sum(index + delta in mines
+                   for delta in table.deltas[table.cellClass[index]])
+               == board[index] & CELL_NUMBER for index in openCells):
+            total += 1
+            for index in placement:
+                counts[index] += 1
+    return {index: count / total for index, count in counts.items()}
+
+
+def playRandomly(game: Game, rng: random.Random, check):
+    # Opens hinted cells with correct flags placed and taken off at random,
+    # calling check before every move
+    solver = createSolver(game)
+    while not game.gameOver:
+        check(game, solver)
+        mines = [index for index in game.mines if not game.board[index] & CELL_FLAG]
+        roll = rng.random()
+        if game.flags and roll < 0.2:
+            update = flagCell(game, rng.choice(sorted(game.flags)))
+        elif mines and game.clicks and roll < 0.4:
+            update = flagCell(game, rng.choice(sorted(mines)))
+        else:
+            hint = getHint(solver)
+            if hint is None:
+                break
+            update = openCell(game, hint[0])
+        markChanged(solver, update.rects)
+
+
+def testHintMatchesBruteForce():
+    def check(game: Game, solver: Solver):
+        hint = getHint(solver)
+        if hint is None or game.clicks == 0:
+            return
+        probabilities = getBruteForceProbabilities(game)
+        if probabilities is None:
+            return
+        cell, probability = hint
+        assert abs(probabilities[cell] - probability) < 1e-9
+        assert abs(min(probabilities.values()) - probability) < 1e-9
+
+    for seed in range(100):
+        rng = random.Random(seed)
+        playRandomly(createGame(5, 5, 6, seed), rng, check)
+        playRandomly(createGame(6, 4, 5, seed), rng, check)
+
+
+def testIncrementalHintMatchesFreshSolver():
+    def check(game: Game, solver: Solver):
+        hint = getHint(solver)
+        fresh = createSolver(game)
+        freshHint = getHint(fresh)
+        if hint is None or freshHint is None:
+            assert hint == freshHint
+            return
+        assert hint[0] not in fresh.mines
+        assert abs(hint[1] - freshHint[1]) < 1e-9
+
+    for seed in range(100):
+        playRandomly(createGame(7, 9, 8, seed), random.Random(seed), check)
+    for seed in range(20):
+        playRandomly(createGame(16, 16, 40, seed), random.Random(seed), check)
+
+
+def testEstimatedComponentsShareTheMinesLeft(monkeypatch):
+    # With nothing enumerated, cells outside the interior only get local
+    # estimates, and the interior takes its share of what is left
+    monkeypatch.setattr(solverModule, "ENUMERATION_MAX_CELLS", 0)
+    game = createGame(16, 16, 40, 3)
+    openCell(game, 0)
+    hintSolver = createSolver(game)
+    solverModule._propagate(hintSolver)
+    probabilities = solverModule._getProbabilities(hintSolver)
+    frontier = hintSolver.cellConstraints.keys()
+    interior = [index for index, state in enumerate(game.board)
+                if not state & (CELL_OPEN | CELL_FLAG) and index not in frontier
+                and index not in hintSolver.safe and index not in hintSolver.mines]
+    assert frontier and interior
+    minesLeft = game.minesCount - len(hintSolver.mines)
+    expected = minesLeft / (len(interior) + len(frontier))
+    assert all(abs(probabilities[index] - expected) < 1e-9 for index in interior)
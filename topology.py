@@ -0,0 +1,79 @@
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, Final
+
+
+@dataclass
+class TopologyName:
+    GRID: Final[str] = "GRID"
+    TORUS: Final[str] = "TORUS"
+
+
+@dataclass(frozen=True)
+class NeighbourTable:
+    name: str
+    # One class id per cell, cells of the same class share neighbour deltas
+    cellClass: bytes
+    # deltas[cellClass[index]] are added to index to get its neighbours
+    deltas: tuple[tuple[int, ...], ...]
+
+
+def _getEdgeClass(maxX: int, maxY: int, x: int, y: int) -> int:
+    return ((x == 0) | (x == maxX - 1) << 1 |
+            (y == 0) << 2 | (y == maxY - 1) << 3)
+
+
+def buildNeighbourTable(name: str, maxX: int, maxY: int,
+                        getNeighbours: Callable[[int, int], list[tuple[int, int]]]) -> NeighbourTable:
+    # Neighbour offsets only change at the board edges, so cells are grouped
+    # by which edges they touch and each group stores its offsets once
+    columnClasses = bytes(_getEdgeClass(maxX, maxY, x, 1) & 0b0011
+                          for x in range(maxX))
+    rowsByClass: dict[int, bytes] = {}
+    rows: list[bytes] = []
+    for y in range(maxY):
+        rowClass = _getEdgeClass(maxX, maxY, 1, y) & 0b1100
+        if rowClass not in rowsByClass:
+            rowsByClass[rowClass] = bytes(columnClass | rowClass
+                                          for columnClass in columnClasses)
+        rows.append(rowsByClass[rowClass])
+    cellClass = b"".join(rows)
+
+    deltas: list[tuple[int, ...]] = []
+    for classId in range(16):
+        index = cellClass.find(classId)
+        if index == -1:
+            deltas.append(())
+            continue
+        y, x = divmod(index, maxX)
+        neighbours = {neighbourY * maxX + neighbourX
+                      for neighbourX, neighbourY in getNeighbours(x, y)}
+        neighbours.discard(index)
+        deltas.append(tuple(sorted(neighbour - index
+                      for neighbour in neighbours)))
+
+    return NeighbourTable(name, cellClass, tuple(deltas))
+
+
+@lru_cache(maxsize=4)
+def getGridTable(maxX: int, maxY: int) -> NeighbourTable:
+    def getNeighbours(x: int, y: int) -> list[tuple[int, int]]:
+        return [(x + i, y + j) for i in range(-1, 2) for j in range(-1, 2)
+                if 0 <= x + i < maxX and 0 <= y + j < maxY]
+
+    return buildNeighbourTable(TopologyName.GRID, maxX, maxY, getNeighbours)
+
+
+@lru_cache(maxsize=4)
+def getTorusTable(maxX: int, maxY: int) -> NeighbourTable:
+    def getNeighbours(x: int, y: int) -> list[tuple[int, int]]:
+        return [((x + i) % maxX, (y + j) % maxY)
+                for i in range(-1, 2) for j in range(-1, 2)]
+
+    return buildNeighbourTable(TopologyName.TORUS, maxX, maxY, getNeighbours)
+
+
+def getNeighbourTable(name: str, maxX: int, maxY: int) -> NeighbourTable:
+    if name == TopologyName.TORUS:
+        return getTorusTable(maxX, maxY)
+    return getGridTable(maxX, maxY)